@@ -1,14 +1,15 @@
-import struct
 from abc import ABC, abstractmethod
 import time
 from epuck_state import *
+from epuck_packets import SENSORS_PACKET, SENSORS_PACKET_LEN, SENSORS_PACKET_COM_LEN
+from epuck_frames import FramePool
 
 ###Constants for user use
 CAM_MODE_RGB565 = 1
 CAM_MODE_GREY = 0
     
 #internal constants
-_RESPONSE_PACKET_LEN = 104
+_RESPONSE_PACKET_LEN = SENSORS_PACKET_LEN
 
 class EPuck(ABC):
     ###Public state variables for external use
@@ -16,27 +17,54 @@ class EPuck(ABC):
     #library state variables
     enable_camera = False     #when enabled, requests and gets camera frame each update.
     enable_sensors = False     #when enabled, requests and gets camera frame each update.
-
-    state = EPuckState()
+    skip_unchanged_commands = False  #when enabled, a command identical to the last one sent is not transmitted.
+
+    sens_framebuffer = None     #latest camera frame data, the buffer of sens_frame
+    sens_frame = None           #latest camera frame as an epuck_frames.Frame, with frame_id and arrival timestamp
+    frame_pool = None           #epuck_frames.FramePool camera frames are received into
+    tracer = None               #epuck_trace.Tracer to record timing spans into, None for no tracing
+
+    #camera parameters loaded from robot/library
+    cam_mode = -1
+    cam_width = -1
+    cam_height = -1
+    cam_zoom = -1
+    cam_framebytes = -1
+
+    #arrival bookkeeping for the data currently in the state
+    sensors_seq = 0             #counts sensor packets received
+    sensors_timestamp = 0.0     #time.monotonic() when that sensor packet arrived
+    frame_seq = 0               #frame_id of sens_frame
+    frame_timestamp = 0.0
 
     def __init__(self, debug=False, timeout=10):  #timeout in s
+        self.state = EPuckState()
         self.act_speaker_sound = None
         self._debug = debug
         self._timeout = timeout
+        self._listeners = []
+        self._command_listeners = []
+        self._update_listeners = []
 
     def __str__(self):
         return str(self.state)
 
-    def _debug_print(self, msg):
-        if(self._debug): print(self.__class__.__name__+": "+msg)
+    # msg is %-formatted with args only when debugging is on. In hot paths also guard the call with
+    # if (self._debug): so not even the call is made.
+    def _debug_print(self, msg, *args):
+        if(self._debug): print(self.__class__.__name__+": "+(msg % args if args else msg))
 
     ### COMM methods
     def connect(self):
+        tracer = self.tracer
+        if (tracer is not None): start = tracer.now()
         self._debug_print("attempting to connect")
-        if (not self._internal_connect()):   
+        connected = self._internal_connect()
+        if (tracer is not None): tracer.complete("connect", start, {"connected": connected})
+        if (not connected):
             self._debug_print("failed to connect")
             return False
-        self._debug_print(f"connected")
+        self._debug_print("connected")
         return True
 
     @abstractmethod
@@ -49,17 +77,34 @@ class EPuck(ABC):
     
     #send a robot command using the configured state variables
     def send_command(self):
-        self._debug_print("sending command")
-        self._writeData(self._make_command_packet())
-        self._debug_print("command sent")
+        tracer = self.tracer
+        if (tracer is not None): start = tracer.now()
+        packet = self._make_command_packet()
+        if (self.skip_unchanged_commands and not self._command_pending()):
+            if (self._debug): self._debug_print("command unchanged, not sent")
+        else:
+            if (self._debug): self._debug_print("sending command")
+            self._writeData(packet)
+            if (self._command_listeners): self._notify_command(packet)
+            self._command.mark_sent()
+            if (self._debug): self._debug_print("command sent")
         self.act_speaker_sound = SOUND_NOCHANGE #to avoid re-starting sound each time, only do once.
+        if (tracer is not None): tracer.complete("send_command", start)
         
     #stop motion, sound, etc.
     def stop_all(self):
         self.state.stop_all()
         self._debug_print("issuing stop command")
         self.send_command()
-        time.sleep(2)  #add a sleep because its common to just close after before the buffer is clear
+        self.sleep(2)  #add a sleep because its common to just close after before the buffer is clear
+
+    #time keeping for controllers. Use these instead of time.sleep/time.monotonic so the same controller also runs
+    # on a simulated robot with a virtual clock (see epuck_sim)
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def monotonic(self):
+        return time.monotonic()
     
     ### Com method specific commands
     
@@ -67,6 +112,11 @@ class EPuck(ABC):
     @abstractmethod
     def data_update(self):
         pass
+
+    #send changes to enable_camera/enable_sensors now instead of on the next data_update. only does something for com
+    # methods that stream (EPuckIP), the others request what is enabled on every update anyway
+    def apply_stream_settings(self):
+        pass
     
     @abstractmethod
     def _internal_connect(self):
@@ -96,64 +146,88 @@ class EPuck(ABC):
     def _make_command_packet(self):
         pass
 
-    def _make_command_packet_core(self):
-
-        ### You can send whatever commands you want. In this comm package, we request a state update and immediately
-        # send a command packet with all the actuators, as a set.
-        # it doesn't need to be this way, you can just get sensors or actuators or a subset (see docs as per above)
-
-        #convert motor speeds to 16 bit little endian
-        left_motor_speed = struct.pack('<h', int(self.state.act_left_motor_speed))
-        right_motor_speed = struct.pack('<h', int(self.state.act_right_motor_speed))
-
-        led_bits = 0x00
-        for i in range(BINARY_LED_COUNT):
-            if self.state.act_binary_led_states[i]: led_bits = led_bits | (1 << i)
-
-        command = bytearray([
-            0,		                        # don't bother with settings, check docs for options
-            left_motor_speed[0],		    # left motor speed LSB
-            left_motor_speed[1],		    # left motor speed MSB
-            right_motor_speed[0],		    # right motor speed LSB
-            right_motor_speed[1],		    # right motor speed MSB
-            led_bits,	                    # binary LEDs
-            self.state.act_rgb_led_colors[0][R],		# LED2 red
-            self.state.act_rgb_led_colors[0][G],		# LED2 green
-            self.state.act_rgb_led_colors[0][B],	    # LED2 blue
-            self.state.act_rgb_led_colors[1][R],		# LED4 red
-            self.state.act_rgb_led_colors[1][G],		# LED4 green
-            self.state.act_rgb_led_colors[1][B],	    # LED4 blue
-            self.state.act_rgb_led_colors[2][R],		# LED6 red
-            self.state.act_rgb_led_colors[2][G],		# LED6 green
-            self.state.act_rgb_led_colors[2][B],	    # LED6 blue
-            self.state.act_rgb_led_colors[3][R],		# LED8 red
-            self.state.act_rgb_led_colors[3][G],		# LED8 green
-            self.state.act_rgb_led_colors[3][B],	    # LED8 blue
-            self.state.act_speaker_sound	# speaker
-        ])
-        return command
-    
+    ### You can send whatever commands you want. In this comm package, we request a state update and immediately
+    # send a command packet with all the actuators, as a set.
+    # it doesn't need to be this way, you can just get sensors or actuators or a subset (see docs as per above)
+    # Subclasses keep the packet in a persistent epuck_packets.CommandPacket (self._command), patched only where the
+    # actuator state changed.
+
+    #true if the packet built by _make_command_packet has to go out even with skip_unchanged_commands set
+    def _command_pending(self):
+        return self._command.dirty
+
+    #latest camera frame as a numpy array, see epuck_camera. pass out= to reuse the destination array
+    def decode_frame(self, out=None):
+        import epuck_camera  # numpy is only needed when frames are decoded
+        return epuck_camera.decode_frame(self.cam_mode, self.sens_framebuffer, self.cam_width, self.cam_height, out)
+
+    ### packet listeners
+    # objects with on_sensors(robot, packet, timestamp) and on_frame(robot, frame) methods, called for every packet as
+    # it is received, e.g., epuck_recorder.TelemetryRecorder. packet is the raw sensor packet and only valid during
+    # the call. With EPuckIP background receive, listeners run on the reader thread.
+    # Optionally also on_command(robot, packet, timestamp), called for every command packet written, and
+    # on_update(robot, timestamp), called when data_update returns (every com method, and Fleet.data_update), e.g.,
+    # epuck_stats.LinkStats.
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+        if (hasattr(listener, "on_command")): self._command_listeners.append(listener)
+        if (hasattr(listener, "on_update")): self._update_listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self._listeners.remove(listener)
+        if (listener in self._command_listeners): self._command_listeners.remove(listener)
+        if (listener in self._update_listeners): self._update_listeners.remove(listener)
+
+    def _notify_sensors(self, packet, timestamp):
+        for listener in self._listeners: listener.on_sensors(self, packet, timestamp)
+
+    def _notify_frame(self, frame):
+        for listener in self._listeners: listener.on_frame(self, frame)
+
+    def _notify_command(self, packet):
+        timestamp = time.monotonic()
+        for listener in self._command_listeners: listener.on_command(self, packet, timestamp)
+
+    def _notify_update(self):
+        timestamp = time.monotonic()
+        for listener in self._update_listeners: listener.on_update(self, timestamp)
+
+    #called by the com method for every packet received
+    def _sensors_received(self, packet, timestamp):
+        if (self._listeners): self._notify_sensors(packet, timestamp)
+        self.sensors_seq += 1
+        self.sensors_timestamp = timestamp
+        self._parse_sensors_packet(packet)
+
+    # frame is a Frame acquired from frame_pool and filled by the com method, its reference passes to us
+    def _frame_received(self, frame, timestamp):
+        self.frame_pool.stamp(frame, timestamp)
+        if (self._listeners): self._notify_frame(frame)
+        self._set_frame(frame)
+
+    def _set_frame(self, frame):
+        if (self.sens_frame is not None): self.frame_pool.release(self.sens_frame)
+        self.sens_frame = frame
+        self.sens_framebuffer = frame.buffer
+        self.frame_seq = frame.frame_id
+        self.frame_timestamp = frame.timestamp
+
+    #pool matching the current camera parameters, (re)made when they change
+    def _get_frame_pool(self):
+        if (self.frame_pool is None or self.frame_pool.frame_bytes != self.cam_framebytes):
+            if (self.sens_frame is not None): self.frame_pool.release(self.sens_frame)
+            self.sens_frame = None
+            self.frame_pool = FramePool(self.cam_framebytes)
+        return self.frame_pool
+
+    # response can be any buffer (bytes, bytearray, memoryview) of the IP or COM packet length, it is never copied
     def _parse_sensors_packet(self, response):
-        data = struct.unpack("<"+   #epuck is in little endian
-                "3h"+  #accelerometer xes X Y Z
-                "3f"+  #acceleration, orientation, inclination
-                "3h"+   #gyro X Y Z axis values
-                "3f"+   #magnetometer X Y Z axes
-                "B"+   #Temperature in c
-                "HHHHHHHH"+ #proximity sensors
-                "HHHHHHHH"+ #ambient light sensors
-                "H"+    #tof
-                "HHHH" +    #microphones
-                "HH" +   #motors L/R
-                "H"  +   #battery level
-                "?"  +   #SD present
-                "xxx" +  # Rc5 TV protocol, ignored
-                "B" +   #selector
-                "HHH" + #ground proximity
-                "HHH" +  #ground ambient
-                "?"   +  #button
-                "B",
-                response)
-        self.state.load_data(data)
+        tracer = self.tracer
+        if (tracer is None):
+            self.state.load_packet(response)
+            return
+        start = tracer.now()
+        self.state.load_packet(response)
+        tracer.complete("parse", start)
 
 
@@ -0,0 +1,191 @@
+import threading
+import time
+from epuck_stats import Histogram, StreamStats
+
+# Camera and sensor streams sharing one EPuckIP link.
+#
+# On the WiFi protocol the camera bit turns on a stream of 38400 byte frames, and every sensor packet queued behind a
+# frame on the TCP stream waits until the whole frame is through. StreamPolicy instead switches the camera bit on only
+# for one frame at a time, at a target frame rate and/or camera byte budget, so the link carries sensor packets alone
+# in between:
+#
+#   policy = StreamPolicy(fps=5)                   # or camera_bytes_per_second=100000, or both (the lower wins)
+#   robot.add_listener(policy)                     # the policy owns robot.enable_camera from now on
+#   robot.enable_sensors = True
+#   while running:
+#       robot.data_update()                        # the policy decides at the end of each data_update
+#       ...
+#   print(policy.report())
+#
+# Sensor freshness comes first: when a sensor gap during a camera window is longer than max_sensor_gap, the frame
+# rate is halved (down to min_fps), and it creeps back up to the target while the gaps stay short. Frames can only
+# start and stop on data_update calls, so call it a good deal faster than the frame rate; each extra frame that
+# arrives in a window is still counted in the stats.
+#
+# It works on any EPuck and under epuck_fleet.Fleet (whose data_update calls on_update too), but only pays off on
+# EPuckIP: the other com methods request a frame per update anyway, and there the camera setting simply takes effect on
+# the next data_update.
+#
+# Per stream (sensors, frames) the policy keeps epuck_stats.StreamStats, plus the sensor gaps with the camera on and
+# off, the camera duty cycle and the achieved frame rate.
+
+
+class StreamPolicy():
+    """EPuck listener that duty cycles the camera stream, see above."""
+
+    def __init__(self, fps=None, camera_bytes_per_second=None, max_sensor_gap=0.05, min_fps=0.5, frame_timeout=0.5,
+                 recover=0.1):
+        """
+        Args:
+            fps: target frame rate.
+            camera_bytes_per_second: camera byte budget, converted to a frame rate with the robot's cam_framebytes.
+            max_sensor_gap: longest acceptable time between sensor packets while a frame is coming in, in s.
+            min_fps: the frame rate never backs off below this.
+            frame_timeout: a camera window with no frame ends after this many s.
+            recover: share of the target frame rate won back after each frame without a long sensor gap.
+        """
+        if (fps is None and camera_bytes_per_second is None): raise ValueError("need fps and/or camera_bytes_per_second")
+        self.fps = fps
+        self.camera_bytes_per_second = camera_bytes_per_second
+        self.max_sensor_gap = max_sensor_gap
+        self.min_fps = min_fps
+        self.frame_timeout = frame_timeout
+        self.recover = recover
+
+        self.sensors = StreamStats()
+        self.frames = StreamStats()
+        self.gap_camera_on = Histogram()    # s between sensor packets while a camera window is open
+        self.gap_camera_off = Histogram()
+        self.windows = 0                    # camera windows opened
+        self.timeouts = 0                   # windows closed with no frame in
+        self.backoffs = 0                   # frame rate halvings for a long sensor gap
+        self.scale = 1.0                    # share of the target frame rate currently used
+        self._lock = threading.Lock()       # with EPuckIP background receive the packets come in on the reader thread
+
+        self._camera_on = False
+        self._window_start = None
+        self._next_window = None            # when the next camera window may open
+        self._frame_in = False              # a frame arrived in the open window
+        self._starved = False               # a long sensor gap happened in the open window
+        self._last_sensors = None
+        self._on_time = 0.0                 # total s with the camera window open
+        self._start = None
+
+    def target_fps(self, robot):
+        rates = []
+        if (self.fps is not None): rates.append(self.fps)
+        if (self.camera_bytes_per_second is not None and robot.cam_framebytes > 0):
+            rates.append(self.camera_bytes_per_second / robot.cam_framebytes)
+        if (not rates): return self.min_fps   # byte budget only, and the frame size isn't known yet
+        return max(self.min_fps, min(rates) * self.scale)
+
+    ### listener interface
+    def on_sensors(self, robot, packet, timestamp):
+        with self._lock:
+            self.sensors.record(timestamp, len(packet))
+            if (self._last_sensors is not None):
+                gap = timestamp - self._last_sensors
+                if (self._camera_on):
+                    self.gap_camera_on.record(gap)
+                    if (gap > self.max_sensor_gap): self._starved = True
+                else:
+                    self.gap_camera_off.record(gap)
+            self._last_sensors = timestamp
+
+    def on_frame(self, robot, frame):
+        with self._lock:
+            self.frames.record(frame.timestamp, len(frame.buffer))
+            self._frame_in = True
+
+    def on_update(self, robot, timestamp):
+        if (self._start is None):
+            self._start = timestamp
+            self._next_window = timestamp
+        with self._lock:
+            if (self._camera_on):
+                if (self._frame_in or timestamp - self._window_start > self.frame_timeout):
+                    self._close_window(robot, timestamp)
+            elif (timestamp >= self._next_window and robot.enable_sensors):
+                self._open_window(timestamp)
+        if (robot.enable_camera != self._camera_on):
+            robot.enable_camera = self._camera_on
+            robot.apply_stream_settings()   # now rather than on the next data_update, we are on the user's thread here
+
+    def _open_window(self, timestamp):
+        self._camera_on = True
+        self._window_start = timestamp
+        self._frame_in = self._starved = False
+        self.windows += 1
+
+    def _close_window(self, robot, timestamp):
+        self._camera_on = False
+        self._on_time += timestamp - self._window_start
+        if (not self._frame_in): self.timeouts += 1
+        if (self._starved):
+            self.scale = max(self.scale / 2, 1e-3)
+            self.backoffs += 1
+        else:
+            self.scale = min(1.0, self.scale + self.recover)
+        # windows on a grid from their start, but never back to back after a late one
+        self._next_window = max(self._window_start + 1 / self.target_fps(robot), timestamp)
+
+    ### reporting
+    def stats(self):
+        with self._lock:
+            elapsed = (self._last_sensors or 0) - (self._start or 0)
+            on_time = self._on_time
+            if (self._camera_on and self._last_sensors is not None): on_time += self._last_sensors - self._window_start
+            return {"windows": self.windows, "timeouts": self.timeouts, "backoffs": self.backoffs, "scale": self.scale,
+                    "duty_cycle": on_time / elapsed if elapsed > 0 else 0.0,
+                    "fps": self.frames.packets / elapsed if elapsed > 0 else 0.0,
+                    "sensors_hz": self.sensors.packets / elapsed if elapsed > 0 else 0.0,
+                    "sensors": self.sensors.summary(), "frames": self.frames.summary(),
+                    "gap_camera_on": self.gap_camera_on.summary(), "gap_camera_off": self.gap_camera_off.summary()}
+
+    def report(self):
+        s = self.stats()
+        lines = [f"{s['fps']:.1f} frames/s ({s['windows']} windows, {s['timeouts']} timeouts, {s['backoffs']} backoffs, "
+                 f"camera on {s['duty_cycle']*100:.0f}% of the time), {s['sensors_hz']:.0f} sensor packets/s"]
+        for name in ("sensors", "frames"):
+            stream = s[name]
+            if (stream["packets"]):
+                lines.append(f"{name}: {stream['packets']} packets, {stream['bytes_per_second']['p50']/1000:.1f} kB/s")
+        for name in ("gap_camera_on", "gap_camera_off"):
+            gap = s[name]
+            if (gap["count"]):
+                lines.append(f"sensor {name}: p50 {gap['p50']*1000:.1f} ms p99 {gap['p99']*1000:.1f} ms "
+                             f"max {gap['max']*1000:.1f} ms")
+        return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    from epuck_ip import EPuckIP
+    from epuck_ip_server import EPuckIPServer
+
+    # a slow link: frames as fast as it takes them, 2 ms between 1 kB chunks
+    server = EPuckIPServer(sensor_hz=100, camera_hz=0, max_chunk=1024, chunk_gap=0.002, seed=1)
+    port = server.start()
+    for policy in (None, StreamPolicy(fps=5)):
+        robot = EPuckIP("127.0.0.1", port)
+        robot.connect()
+        robot.enable_sensors = True
+        gaps = Histogram()
+        last = None
+        if (policy is not None): robot.add_listener(policy)
+        else: robot.enable_camera = True
+        start = time.monotonic()
+        while (time.monotonic() - start < 3):
+            seq = robot.sensors_seq
+            robot.data_update()
+            if (robot.sensors_seq != seq):
+                if (last is not None): gaps.record(robot.sensors_timestamp - last)
+                last = robot.sensors_timestamp
+            time.sleep(0.001)
+        elapsed = time.monotonic() - start
+        robot.close()
+        print("policy" if policy is not None else "camera always on")
+        print(f"  {robot.sensors_seq / elapsed:.0f} sensor packets/s, {robot.frame_seq / elapsed:.1f} frames/s, "
+              f"sensor gap p50 {gaps.percentile(50)*1000:.1f} ms p99 {gaps.percentile(99)*1000:.1f} ms "
+              f"max {(gaps.max or 0)*gaps.unit*1000:.1f} ms")
+        if (policy is not None): print("  " + policy.report().replace("\n", "\n  "))
+    server.stop()
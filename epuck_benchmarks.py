@@ -0,0 +1,280 @@
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+import timeit
+
+import epuck_helper_functions as helper
+from epuck_inverse_kinematics import diff_drive_inverse_kin
+from epuck_open_loop_forward_kinematics import diff_drive_forward_kin
+from epuck_packets import SENSORS_PACKET, SENSORS_PACKET_LEN
+from epuck_state import EPuckState
+
+# Benchmarks of the library hot paths. Each benchmark is timed with timeit (auto ranged so one repeat takes at least
+# 0.2s, best/median of the repeats) and reported in ns per call. Results are saved as JSON so runs can be compared:
+#
+#   python epuck_benchmarks.py -o baseline.json
+#   ... change things ...
+#   python epuck_benchmarks.py -o new.json --compare baseline.json   # exit code 1 if anything got slower
+#
+# Run a subset with -k, e.g., -k kinematics. numpy benchmarks are skipped when numpy is not installed.
+
+DEFAULT_REPEAT = 5
+DEFAULT_TOLERANCE = 0.10   # slowdown ratio counted as a regression
+
+
+### benchmark registry
+_benchmarks = []
+
+
+def benchmark(name):
+    """Register a setup function. It returns the callable to time, or None to skip the benchmark."""
+    def register(setup):
+        _benchmarks.append((name, setup))
+        return setup
+    return register
+
+
+def _sensor_packet():
+    values = [0]*46
+    values[0:3] = (120, -45, 16000)
+    values[3:6] = (1.5, 90.0, 12.5)
+    values[13:21] = range(100, 108)
+    values[34:36] = (12345, 54321)
+    values[36] = 3900
+    packet = bytearray(SENSORS_PACKET.pack(*values))
+    packet.extend(bytes(SENSORS_PACKET_LEN - len(packet)))
+    return packet
+
+
+@benchmark("command_packet.build_changed")
+def _command_changed():
+    from epuck_ip import EPuckIP
+    robot = EPuckIP("127.0.0.1")
+    robot.enable_sensors = True
+    speeds = [100, -100]
+    def run():
+        speeds.reverse()
+        robot.state.act_left_motor_speed = speeds[0]   # the motor field changes each call
+        robot._make_command_packet()
+    return run
+
+
+@benchmark("command_packet.build_unchanged")
+def _command_unchanged():
+    from epuck_ip import EPuckIP
+    robot = EPuckIP("127.0.0.1")
+    robot.state.act_left_motor_speed = 100
+    return robot._make_command_packet
+
+
+@benchmark("sensors.parse_packet")
+def _parse_packet():
+    state = EPuckState()
+    packet = _sensor_packet()
+    return lambda: state.load_packet(packet)
+
+
+@benchmark("sensors.unpack_and_load_data")
+def _load_data():
+    state = EPuckState()
+    packet = _sensor_packet()
+    return lambda: state.load_data(SENSORS_PACKET.unpack_from(packet))
+
+
+@benchmark("history.append")
+def _history_append():
+    try:
+        from epuck_history import SensorHistory
+    except ImportError:
+        return None
+    history = SensorHistory(capacity=1024)
+    packet = _sensor_packet()
+    return lambda: history.append(packet, 0.0)
+
+
+@benchmark("kinematics.forward")
+def _forward_kin():
+    pose = (10.0, 20.0, math.pi / 2)
+    return lambda: diff_drive_forward_kin(pose, 1991, 2075)
+
+
+@benchmark("kinematics.forward_batch_10k")
+def _forward_kin_batch():
+    from epuck_open_loop_forward_kinematics import diff_drive_forward_kin_batch, np
+    counts = np.cumsum(np.random.default_rng(0).integers(0, 200, (2, 10000)), axis=1) % 2**16
+    return lambda: diff_drive_forward_kin_batch((0, 0, 0), counts[0], counts[1])
+
+
+@benchmark("kinematics.inverse")
+def _inverse_kin():
+    return lambda: diff_drive_inverse_kin(200, 70, math.pi / 4)
+
+
+@benchmark("kinematics.inverse_batch_1k")
+def _inverse_kin_batch():
+    from epuck_inverse_kinematics import diff_drive_inverse_kin_batch, np
+    rng = np.random.default_rng(0)
+    distances = np.where(rng.random(1000) < 0.3, 0, rng.uniform(-500, 500, 1000))
+    speeds, omegas = rng.uniform(10, 150, 1000), rng.uniform(-np.pi, np.pi, 1000)
+    return lambda: diff_drive_inverse_kin_batch(distances, speeds, omegas)
+
+
+@benchmark("helpers.steps_to_mm")
+def _steps_to_mm():
+    return lambda: helper.steps_to_mm(1290)
+
+
+@benchmark("helpers.mm_to_steps")
+def _mm_to_steps():
+    return lambda: helper.mm_to_steps(130)
+
+
+@benchmark("helpers.steps_delta")
+def _steps_delta():
+    return lambda: helper.steps_delta(32700, 120)
+
+
+def _rgb565_setup(use_lut):
+    try:
+        import epuck_camera
+    except ImportError:
+        return None
+    frame = bytes(range(256)) * 150   # 160x120 RGB565
+    out = epuck_camera.np.empty((120, 160, 3), dtype=epuck_camera.np.uint8)
+    epuck_camera.rgb565_to_rgb(frame, 160, 120, out, use_lut)   # builds the lookup table outside the timing
+    return lambda: epuck_camera.rgb565_to_rgb(frame, 160, 120, out, use_lut)
+
+
+@benchmark("camera.rgb565_decode")
+def _rgb565_shift():
+    return _rgb565_setup(False)
+
+
+@benchmark("camera.rgb565_decode_lut")
+def _rgb565_lut():
+    return _rgb565_setup(True)
+
+
+class _IPCycle():
+    """One EPuckIP data_update that has a fresh sensor packet to take in, against a local EPuckIPServer."""
+
+    def __init__(self):
+        from epuck_ip import EPuckIP
+        from epuck_ip_server import EPuckIPServer
+        self.server = EPuckIPServer(sensor_hz=0, camera_hz=0)   # stream as fast as the socket takes it
+        port = self.server.start()
+        self.robot = EPuckIP("127.0.0.1", port)
+        if (not self.robot.connect()): raise OSError("could not connect to the local server")
+        self.robot.enable_sensors = True
+        self.robot.data_update()
+
+    def __call__(self):
+        robot = self.robot
+        robot._dataAvailable(1)
+        robot.data_update()
+
+    def close(self):
+        self.robot.close()
+        self.server.stop()
+
+
+@benchmark("ip.data_update")
+def _ip_cycle():
+    return _IPCycle()
+
+
+### running and comparing
+def time_call(fn, repeat=DEFAULT_REPEAT):
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()   # calls per repeat, so one repeat takes at least 0.2s
+    times = sorted(t / number * 1e9 for t in timer.repeat(repeat, number))
+    return {"ns_per_call": times[len(times) // 2], "best_ns": times[0], "calls": number, "repeat": repeat}
+
+
+def run_benchmarks(select=None, repeat=DEFAULT_REPEAT, verbose=True):
+    results = {}
+    for name, setup in _benchmarks:
+        if (select and not any(s in name for s in select)): continue
+        fn = setup()
+        if (fn is None):
+            if (verbose): print(f"{name:34s} skipped")
+            continue
+        try:
+            results[name] = time_call(fn, repeat)
+        finally:
+            if (hasattr(fn, "close")): fn.close()
+        if (verbose): print(f"{name:34s} {_format_ns(results[name]['ns_per_call'])}")
+    return results
+
+
+def _format_ns(ns):
+    if (ns >= 1e6): return f"{ns / 1e6:10.2f} ms"
+    if (ns >= 1e3): return f"{ns / 1e3:10.2f} us"
+    return f"{ns:10.1f} ns"
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def environment():
+    env = {"python": platform.python_version(), "implementation": platform.python_implementation(),
+           "machine": platform.machine(), "system": platform.system(), "processor": platform.processor(),
+           "git": _git_revision(), "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    try:
+        import numpy
+        env["numpy"] = numpy.__version__
+    except ImportError:
+        env["numpy"] = None
+    return env
+
+
+def save_results(path, results):
+    with open(path, "w") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=2, sort_keys=True)
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)["results"]
+
+
+#benchmarks at least tolerance slower than in baseline, as (name, ratio) with ratio new/old
+def compare(baseline, results, tolerance=DEFAULT_TOLERANCE, verbose=True):
+    regressions = []
+    for name, result in results.items():
+        if (name not in baseline): continue
+        ratio = result["ns_per_call"] / baseline[name]["ns_per_call"]
+        slower = ratio > 1 + tolerance
+        if (slower): regressions.append((name, ratio))
+        if (verbose):
+            print(f"{name:34s} {_format_ns(baseline[name]['ns_per_call'])} -> {_format_ns(result['ns_per_call'])}"
+                  f"  x{ratio:.2f}{'  REGRESSION' if slower else ''}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the e-puck library hot paths.")
+    parser.add_argument("-o", "--output", help="save results to this JSON file")
+    parser.add_argument("-c", "--compare", help="baseline JSON file to compare against")
+    parser.add_argument("-t", "--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="slowdown ratio counted as a regression (default %(default)s)")
+    parser.add_argument("-k", action="append", dest="select", help="only run benchmarks whose name contains this")
+    parser.add_argument("-r", "--repeat", type=int, default=DEFAULT_REPEAT)
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.select, args.repeat)
+    if (args.output): save_results(args.output, results)
+    if (args.compare):
+        print()
+        regressions = compare(load_results(args.compare), results, args.tolerance)
+        if (regressions): sys.exit(1)
@@ -0,0 +1,113 @@
+import numpy as np
+import epuck
+
+# Camera frame decoding into numpy arrays.
+# RGB565 frames come out as height x width x 3 uint8 arrays, greyscale frames as height x width uint8 arrays.
+# Every decoder takes an optional out= array to decode into, so a video loop can reuse one destination array.
+
+_rgb565_lut = None   #65536 entry rgb lookup table, built on first use
+
+
+def _get_rgb565_lut():
+    global _rgb565_lut
+    if (_rgb565_lut is None):
+        pixels = np.arange(1 << 16, dtype=np.uint32)
+        lut = np.empty((1 << 16, 3), dtype=np.uint8)
+        lut[:, 0] = (pixels >> 8) & 0xF8   # top 5 bits are red
+        lut[:, 1] = (pixels >> 3) & 0xFC   # middle 6 bits are green
+        lut[:, 2] = (pixels << 3) & 0xF8   # bottom 5 bits are blue
+        _rgb565_lut = lut.view("V3").reshape(-1)   # one 3 byte item per pixel value, so take copies whole pixels
+    return _rgb565_lut
+
+
+def _output(out, shape):
+    if (out is None): return np.empty(shape, dtype=np.uint8)
+    if (out.shape != shape or out.dtype != np.uint8):
+        raise ValueError(f"out must be a uint8 array of shape {shape}, got {out.dtype} {out.shape}")
+    if (not out.flags.c_contiguous):  # reshape would hand back a copy and the pixels would never reach out
+        raise ValueError("out must be C contiguous")
+    return out
+
+
+def rgb565_to_rgb(data, width, height, out=None, use_lut=False):
+    """
+    Decode an RGB565 frame into an RGB array.
+
+    Args:
+        data: frame buffer (bytes, bytearray, memoryview), 2 bytes per pixel, big endian as sent by the camera.
+        width, height: frame size in pixels.
+        out: optional height x width x 3 uint8 array to decode into.
+        use_lut: decode with the 65536 entry lookup table (one gather per pixel) instead of bit operations.
+            Which one is faster depends on the machine, time both with epuck_benchmarks.
+
+    Returns:
+        height x width x 3 uint8 array (out, if given).
+    """
+    pixels = np.frombuffer(data, dtype=">u2", count=width*height)
+    out = _output(out, (height, width, 3))
+    _rgb565_into(pixels, out.reshape(-1, 3), use_lut)
+    return out
+
+
+# pixels: n 16 bit pixel values, rgb: n x 3 contiguous uint8 destination
+def _rgb565_into(pixels, rgb, use_lut):
+    pixels = pixels.astype(np.uint16)   # native byte order, still 16 bit
+    if (use_lut):
+        np.take(_get_rgb565_lut(), pixels, out=rgb.view("V3").reshape(-1))
+        return
+    # shift each channel straight into its uint8 column, no widened temporaries
+    red, green, blue = rgb[:, 0], rgb[:, 1], rgb[:, 2]
+    np.right_shift(pixels, 8, out=red, casting="unsafe")
+    np.bitwise_and(red, 0xF8, out=red)          # top 5 bits are red
+    np.right_shift(pixels, 3, out=green, casting="unsafe")
+    np.bitwise_and(green, 0xFC, out=green)      # middle 6 bits are green
+    np.left_shift(pixels, 3, out=blue, casting="unsafe")
+    np.bitwise_and(blue, 0xF8, out=blue)        # bottom 5 bits are blue
+
+
+def grey_to_array(data, width, height, out=None):
+    """
+    Greyscale frame as a height x width uint8 array. Without out this is a view onto data, not a copy.
+    """
+    pixels = np.frombuffer(data, dtype=np.uint8, count=width*height).reshape(height, width)
+    if (out is None): return pixels
+    np.copyto(_output(out, (height, width)), pixels)
+    return out
+
+
+def decode_frame(mode, data, width, height, out=None):
+    if (mode == epuck.CAM_MODE_RGB565): return rgb565_to_rgb(data, width, height, out)
+    if (mode == epuck.CAM_MODE_GREY): return grey_to_array(data, width, height, out)
+    raise ValueError(f"unknown camera mode {mode}")
+
+
+def decode_frames(mode, frames, width, height, out=None, use_lut=False):
+    """
+    Decode many frames at once, e.g., for offline processing of a recording.
+
+    Args:
+        mode: epuck.CAM_MODE_RGB565 or epuck.CAM_MODE_GREY.
+        frames: sequence of frame buffers, or an n x framebytes uint8 array.
+        width, height: frame size in pixels.
+        out: optional n x height x width (x 3 for RGB565) uint8 array to decode into.
+        use_lut: as for rgb565_to_rgb.
+
+    Returns:
+        n x height x width x 3 (RGB565) or n x height x width (grey) uint8 array.
+    """
+    if (isinstance(frames, np.ndarray)):
+        raw = np.ascontiguousarray(frames, dtype=np.uint8).reshape(len(frames), -1)
+    else:
+        raw = np.stack([np.frombuffer(frame, dtype=np.uint8) for frame in frames])
+    count = len(raw)
+
+    if (mode == epuck.CAM_MODE_RGB565):
+        pixels = raw[:, :2*width*height].view(">u2")
+        out = _output(out, (count, height, width, 3))
+        _rgb565_into(pixels.reshape(-1), out.reshape(-1, 3), use_lut)
+        return out
+    if (mode == epuck.CAM_MODE_GREY):
+        out = _output(out, (count, height, width))
+        np.copyto(out.reshape(count, -1), raw[:, :width*height])
+        return out
+    raise ValueError(f"unknown camera mode {mode}")
@@ -1,5 +1,8 @@
 import epuck
 import serial
+import time
+from collections import deque
+from epuck_packets import CommandPacket
 
 class EPuckCom(epuck.EPuck):
     ### Constants and commands specific to comport communication
@@ -17,10 +20,21 @@ class EPuckCom(epuck.EPuck):
     _CMD_SET_CAM_PARAMETERS = 'J'
 
 
-    def __init__(self, port, baud=115200, debug=False, timeout=15):  #timeout in s
+    # pipeline_depth: 0 runs request/response in lockstep. N > 0 keeps N requests in flight, the next request is
+    #  sent before the previous response is decoded so the serial link doesn't idle. Responses are then N updates old.
+    def __init__(self, port, baud=115200, debug=False, timeout=15, pipeline_depth=0):  #timeout in s
         super().__init__(debug, timeout)
         self._port = port
         self._baud = baud
+        self._command = CommandPacket(header=[self._CMD_GET_ALL_SENSORS, self._CMD_SET_ALL_ACTUATORS], trailer=[0])
+
+        self.pipeline_depth = pipeline_depth
+        self._in_flight = deque()   # (sensors, camera) requested, per request sent and not yet read
+
+        self.packets_per_second = 0.0   # achieved responses per second, updated about once a second
+        self.incomplete_frames = 0      # camera frames dropped because the read timed out part way
+        self._rate_count = 0
+        self._rate_start = time.monotonic()
  
 
     ### COMM methods
@@ -51,6 +65,7 @@ class EPuckCom(epuck.EPuck):
         if (x==-1): x=width
         if (y==-1): y=width
         command_string = f"{self._CMD_SET_CAM_PARAMETERS},{mode},{width},{height},{zoom},{x},{y}\n" 
+        self._drain_pipeline()  # ascii responses can't be told apart from binary ones still in flight
 
         self._debug_print("setting camera parameters")
         self._writeData(command_string.encode("ascii"))
@@ -61,6 +76,7 @@ class EPuckCom(epuck.EPuck):
 
     def get_camera_parameters(self):
         command_string = self._CMD_GET_CAM_PARAMETERS+"\n"
+        self._drain_pipeline()
 
         self._writeData(command_string.encode("ascii"))
         response = self._s_com.readline(self._MAX_READLINE)  ##ascii mode, don't use _readData
@@ -75,57 +91,123 @@ class EPuckCom(epuck.EPuck):
         self.data_update()
                   
     def data_update(self):  #request data and get it
+        tracer = self.tracer
+        if (tracer is not None): start = tracer.now()
+        if (self.pipeline_depth > 0):
+            self._pipelined_update()
+        else:
+            self._lockstep_update()
+        if (self._update_listeners): self._notify_update()
+        if (tracer is not None): tracer.complete("data_update", start)
+
+    def _lockstep_update(self):
         super().send_command() # send request for data
         
         if (self.enable_sensors):  # above send?command already requested sensor data.
-            self._debug_print("waiting for data")
-            response = self._readData(size=epuck._RESPONSE_PACKET_LEN-1) # -1 for reserved byte. seems to not show up on com
-            response += b'0'  #pad the reserved end byte
-            self._debug_print("response received, parsing")
-            self._parse_sensors_packet(response)
-            self._debug_print("parsing complete, update complete")
+            if (self._debug): self._debug_print("waiting for data")
+            response = self._readData(size=epuck.SENSORS_PACKET_COM_LEN) # reserved end byte does not show up on com, decoder doesn't need it
+            if (self._debug): self._debug_print("response received, parsing")
+            self._sensors_received(response, time.monotonic())
+            if (self._debug): self._debug_print("parsing complete, update complete")
             
         if(self.enable_camera):
             if (self.cam_framebytes == -1): # camera parameters not yet received
                 self._debug_print("first getting camera parameters")
                 self.get_camera_parameters()
                 
-            self.sens_framebuffer = response = self._get_cam_frame()
-
-
-
-    def _get_cam_frame(self):  #sends command to request camera frame and parses repsonse
-        self._debug_print("sending command to request camera frame")
+            self._request_cam_frame()
+            frame = self._read_cam_frame()
+            if (frame is not None): self._frame_received(frame, time.monotonic())
+
+        self._count_response()
+
+    def _pipelined_update(self):
+        if (self.enable_camera and self.cam_framebytes == -1):
+            self._debug_print("first getting camera parameters")
+            self.get_camera_parameters()
+
+        while (len(self._in_flight) < self.pipeline_depth):
+            self._send_request()
+
+        sensors, camera = self._in_flight.popleft()
+        if (sensors):
+            response = self._readData(size=epuck.SENSORS_PACKET_COM_LEN)
+            sensors_time = time.monotonic()
+        if (camera):
+            frame = self._read_cam_frame()
+            frame_time = time.monotonic()
+
+        self._send_request()  # keep the link busy while we decode
+
+        if (sensors): self._sensors_received(response, sensors_time)
+        if (camera and frame is not None): self._frame_received(frame, frame_time)
+        self._count_response()
+
+    #one pipelined request: the actuator command, with sensor and camera requests as enabled
+    def _send_request(self):
+        camera = self.enable_camera and self.cam_framebytes != -1
+        super().send_command()
+        if (camera): self._request_cam_frame()
+        self._in_flight.append((self.enable_sensors, camera))
+
+    #read and drop every response still in flight, e.g., before an ascii command
+    def _drain_pipeline(self):
+        while (self._in_flight):
+            sensors, camera = self._in_flight.popleft()
+            if (sensors): self._readData(size=epuck.SENSORS_PACKET_COM_LEN)
+            if (camera):
+                frame = self._read_cam_frame()
+                if (frame is not None): self.frame_pool.release(frame)
+
+    def _count_response(self):
+        self._rate_count += 1
+        now = time.monotonic()
+        if (now - self._rate_start >= 1.0):
+            self.packets_per_second = self._rate_count / (now - self._rate_start)
+            self._rate_count = 0
+            self._rate_start = now
+
+    def _request_cam_frame(self):
+        if (self._debug): self._debug_print("sending command to request camera frame")
         self._writeData(
             bytearray([
                 self._CMD_GET_CAM_FRAME,
                 0   # command ends in null
             ])
         )
-        self._debug_print("command sent, waiting for response")
-        response = self._readData(size=(self.cam_framebytes+self._CAM_HEADER_BYTES))
-        self._debug_print("image received. Mode "+ str(response[0]) + "  width: "+ str(response[1])+ " height: "+str(response[2]))
-        imgarr = response[self._CAM_HEADER_BYTES:]
-        self._debug_print("parsing complete, update complete")
-        return imgarr
+
+    def _read_cam_frame(self):  #reads the response to a camera frame request into a pool frame, None if dropped
+        tracer = self.tracer
+        if (tracer is not None): start = tracer.now()
+        if (self._debug): self._debug_print("command sent, waiting for response")
+        header = self._readData(size=self._CAM_HEADER_BYTES)
+        frame = self._get_frame_pool().acquire()
+        if (frame is None):  # pool exhausted, read and drop the frame
+            self._readData(size=self.cam_framebytes)
+            self.frame_pool.dropped += 1
+            return None
+        count = self._s_com.readinto(frame.buffer)
+        if (count != len(frame.buffer)):  # timed out part way, the rest of the pooled buffer is an old frame
+            self.frame_pool.release(frame)
+            self.incomplete_frames += 1
+            self._debug_print("camera frame incomplete, %s of %d bytes, dropped", count, len(frame.buffer))
+            return None
+        if (self._debug):
+            self._debug_print("image received. Mode %d  width: %d height: %d", header[0], header[1], header[2])
+            self._debug_print("parsing complete, update complete")
+        if (tracer is not None): tracer.complete("frame_receive", start)
+        return frame
 
     ### internal packet packing and unpacking methods
     # protocol taken from https://www.gctronic.com/doc/index.php?title=e-puck2_PC_side_development#WiFi_2
 
     def _make_command_packet(self):
 
-        command_core = self._make_command_packet_core()
-        
-        # add COM specific command header
-        command = bytearray()
-        if (self.enable_sensors): command.extend( bytearray([self._CMD_GET_ALL_SENSORS]))
-        command.extend( bytearray([self._CMD_SET_ALL_ACTUATORS]) )
-        command.extend(command_core)
-        
-        # add COM specific null termination
-        command.extend(bytearray ([0]))
-        return command
+        # COM specific header (sensor request, set actuators) and null termination are part of the persistent packet
+        self._command.update(self.state)
+        if (self.enable_sensors): return self._command.buffer
+        return memoryview(self._command.buffer)[1:]  # no sensor request, skip it
     
-
-
-
+    #a sensor request always has to go out, even if the actuators didn't change
+    def _command_pending(self):
+        return self.enable_sensors or super()._command_pending()
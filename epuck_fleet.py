@@ -0,0 +1,89 @@
+import selectors
+
+# Services many EPuckIP robots from one thread. All robot sockets are registered with a single selector (epoll on
+# linux), so each tick costs one poll for the whole fleet instead of one select call per robot.
+#
+#   fleet = Fleet([EPuckIP("172.20.10.2"), EPuckIP("172.20.10.3")])
+#   fleet.connect_all()
+#   while running:
+#       ... set robot.state actuators ...
+#       fleet.tick()   # send all commands, then read whatever arrived from every robot
+
+class Fleet():
+
+    def __init__(self, robots=()):
+        self._selector = selectors.DefaultSelector()
+        self.robots = []
+        for robot in robots:
+            self.add(robot)
+
+    def __len__(self):
+        return len(self.robots)
+
+    def __iter__(self):
+        return iter(self.robots)
+
+    def add(self, robot):
+        if (robot._background): raise ValueError("fleet robots are polled by the fleet, don't use background receive")
+        self.robots.append(robot)
+        if (robot.is_connected()): self._register(robot)
+
+    def remove(self, robot):
+        self._unregister(robot)
+        self.robots.remove(robot)
+
+    def _register(self, robot):
+        self._selector.register(robot._socket, selectors.EVENT_READ, robot)  # robot rides along as the key data
+
+    def _unregister(self, robot):
+        try:
+            self._selector.unregister(robot._socket)
+        except (KeyError, ValueError):  # not registered, or socket already closed
+            pass
+
+    #connect every robot that isn't yet. returns the list of robots that failed
+    def connect_all(self):
+        failed = []
+        for robot in self.robots:
+            if (robot.is_connected()): continue
+            self._unregister(robot)   # a reconnect replaces the robot's socket
+            if (robot.connect()): self._register(robot)
+            else: failed.append(robot)
+        return failed
+
+    def close_all(self):
+        for robot in self.robots:
+            self._unregister(robot)
+            robot.close()
+
+    def stop_all(self):
+        for robot in self.robots:
+            if (robot.is_connected()): robot.stop_all()
+
+    #send the current actuator state of every connected robot
+    def send_commands(self):
+        for robot in self.robots:
+            if (robot.is_connected()): robot.send_command()
+
+    #read everything waiting on any robot socket into that robot's state, then tell each robot's on_update listeners,
+    # as its own data_update would
+    def data_update(self):
+        for robot in self.robots:
+            if (robot.is_connected()): robot._sync_streams()
+
+        while True:
+            events = self._selector.select(0)   #poll mode, one call for the whole fleet
+            if (not events): break
+            for key, mask in events:
+                robot = key.data
+                robot._receive()   # every complete packet that one recv brought in
+                if (not robot.is_connected()):   # closed by the robot, stop polling it
+                    self._unregister(robot)
+
+        for robot in self.robots:
+            if (robot._update_listeners): robot._notify_update()
+
+    #one control tick: batched commands out, then data in
+    def tick(self):
+        self.send_commands()
+        self.data_update()
@@ -0,0 +1,58 @@
+import threading
+from collections import deque
+
+# Fixed pool of preallocated camera frame buffers. Com methods receive camera data straight into a frame acquired
+# from the pool, so no buffer is allocated per frame at video rate.
+#
+# Reference counting: acquire() hands out a free frame holding one reference. The robot keeps one reference on its
+# latest frame (EPuck.sens_frame) and drops it when the next frame arrives. A consumer that wants to keep a frame past
+# the next data_update calls retain(frame) and later release(frame). Once a frame has no references left it goes back
+# to the pool. If every frame is in use new camera frames are dropped (counted in dropped) until one is released.
+
+class Frame():
+    __slots__ = ("buffer", "frame_id", "timestamp", "_refs")
+
+    def __init__(self, size):
+        self.buffer = bytearray(size)
+        self.frame_id = 0        # monotonically increasing per pool, 0 if never filled
+        self.timestamp = 0.0     # time.monotonic() at arrival
+        self._refs = 0
+
+
+class FramePool():
+
+    def __init__(self, frame_bytes, count=4):
+        self.frame_bytes = frame_bytes
+        self.dropped = 0   # frames that arrived while the pool was exhausted, counted by the com method
+        self._frames = [Frame(frame_bytes) for i in range(count)]
+        self._free = deque(self._frames)
+        self._next_id = 0
+        self._lock = threading.Lock()  # frames are received on reader threads and released by the user
+
+    #a free frame to receive into, or None if all are in use
+    def acquire(self):
+        with self._lock:
+            if (not self._free): return None
+            frame = self._free.popleft()
+            frame._refs = 1
+            return frame
+
+    #mark a freshly received frame with the next id and its arrival time
+    def stamp(self, frame, timestamp):
+        with self._lock:
+            self._next_id += 1
+            frame.frame_id = self._next_id
+        frame.timestamp = timestamp
+
+    def retain(self, frame):
+        with self._lock:
+            frame._refs += 1
+        return frame
+
+    def release(self, frame):
+        with self._lock:
+            frame._refs -= 1
+            if (frame._refs == 0): self._free.append(frame)
+
+    def free_count(self):
+        return len(self._free)
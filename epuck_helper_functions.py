@@ -5,11 +5,11 @@ WHEEL_DIAMETER_MM = 41  # Diameter of the wheel in mm (measured with calipers)
 WHEEL_RADIUS_MM = WHEEL_DIAMETER_MM / 2
 AXLE_LENGTH_MM = 53  # Distance between the wheels (measured with calipers)
 STEPS_PER_REVOLUTION = 1000  # Motor step resolution per wheel rotation
+MAX_STEP_COUNT = 2**16  # Motor step counters are 16-bit and wrap around
 
 # Helper function 1: Calculate step delta with wraparound
 # Handles counter overflow in motor step readings
 def steps_delta(last, current):
-    MAX_STEP_COUNT = 2**15  # Assuming a 16-bit counter
     delta = current - last
     if delta > MAX_STEP_COUNT // 2:
         delta -= MAX_STEP_COUNT
@@ -0,0 +1,136 @@
+import threading
+import numpy as np
+from epuck_packets import SENSORS_PACKET_COM_LEN
+
+# Fixed capacity history of the last N sensor packets with their arrival timestamps. The packets are kept whole in one
+# structured ring array (PACKET_DTYPE rows), so appending is a single byte copy into the ring position and each channel
+# is a strided column view of the ring. Queries are vectorized over a window of the newest packets.
+#
+#   history = SensorHistory(capacity=512)
+#   robot.add_listener(history)            # every received sensor packet is appended
+#   ...
+#   history.mean("proximity", 10)          # per sensor mean of the last 10 packets
+#   history.median("tof", seconds=0.5)     # over the packets of the last half second
+#   history.derivative("left_motor_steps", 20)   # steps/s, counter wraparound handled
+#
+# Channel names: accelerometer (3), acceleration, orientation, inclination, gyro (3), magnetometer (3), temperature,
+# proximity (8), ambient (8), tof, mic (4), left_motor_steps, right_motor_steps, battery, has_SD, selector,
+# ground_prox (3), ground_amb (3), button. Multi value channels give a column per sensor.
+
+# the sensor packet layout (see epuck_packets.SENSORS_PACKET) as a numpy record, little endian like the robot
+PACKET_DTYPE = np.dtype({
+    "names": ["accelerometer", "acceleration", "orientation", "inclination", "gyro", "magnetometer", "temperature",
+              "proximity", "ambient", "tof", "mic", "left_motor_steps", "right_motor_steps", "battery", "has_SD",
+              "selector", "ground_prox", "ground_amb", "button"],
+    "formats": [("<i2", 3), "<f4", "<f4", "<f4", ("<i2", 3), ("<f4", 3), "u1",
+                ("<u2", 8), ("<u2", 8), "<u2", ("<u2", 4), "<u2", "<u2", "<u2", "?", "u1",
+                ("<u2", 3), ("<u2", 3), "?"],
+    "offsets": [0, 6, 10, 14, 18, 24, 36, 37, 53, 69, 71, 79, 81, 83, 85, 89, 90, 96, 102],
+    "itemsize": SENSORS_PACKET_COM_LEN})
+
+_WRAPPING = {"left_motor_steps": 1 << 16, "right_motor_steps": 1 << 16}   # counters that wrap around, and their period
+
+
+class SensorHistory():
+
+    def __init__(self, capacity=1024, channels=None):
+        """
+        Args:
+            capacity: number of packets kept, older ones are overwritten.
+            channels: names of the channels that can be queried, all by default. Packets are stored whole either way.
+        """
+        self.capacity = capacity
+        self.channels = list(channels) if channels is not None else list(PACKET_DTYPE.names)
+        self.ring = np.zeros(capacity, dtype=PACKET_DTYPE)
+        self.columns = {name: self.ring[name] for name in self.channels}
+        self.timestamps = np.zeros(capacity)
+        self.count = 0      # packets appended in total
+        self._next = 0      # ring position the next packet goes to
+        self._bytes = memoryview(self.ring).cast("B")
+        self._lock = threading.RLock()   # with EPuckIP background receive, append runs on the reader thread
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    ### filling
+    def append(self, packet, timestamp):
+        size = PACKET_DTYPE.itemsize
+        with self._lock:
+            i = self._next
+            self._bytes[i*size:(i + 1)*size] = memoryview(packet)[:size]   # the whole row in one copy
+            self.timestamps[i] = timestamp
+            self._next = i + 1 if i + 1 < self.capacity else 0
+            self.count += 1
+
+    def on_sensors(self, robot, packet, timestamp):
+        self.append(packet, timestamp)
+
+    def on_frame(self, robot, frame):
+        pass
+
+    def clear(self):
+        with self._lock:
+            self.count = 0
+            self._next = 0
+
+    ### windows, copies taken under the lock so a concurrent append can't change them
+    def _size(self, n, seconds):
+        size = len(self)
+        if (n is not None): size = min(size, n)
+        if (seconds is not None and size):
+            times = self._chronological(self.timestamps, size)
+            size -= int(np.searchsorted(times, times[-1] - seconds, side="left"))
+        return size
+
+    #the last size rows of a ring column, oldest first, as a new array
+    def _chronological(self, column, size):
+        start = self._next - size
+        if (start >= 0): return column[start:self._next].copy()
+        return np.concatenate((column[start:], column[:self._next]))
+
+    def window(self, name, n=None, seconds=None):
+        """Values of a channel over the last n packets and/or the last seconds (by arrival time), oldest first."""
+        with self._lock:
+            return self._chronological(self.columns[name], self._size(n, seconds))
+
+    def window_timestamps(self, n=None, seconds=None):
+        with self._lock:
+            return self._chronological(self.timestamps, self._size(n, seconds))
+
+    #window as float, with wrapping counters unwrapped so differences are real
+    def _values(self, name, n, seconds):
+        values = self.window(name, n, seconds).astype(np.float64)
+        period = _WRAPPING.get(name)
+        if (period is not None and len(values) > 1):
+            steps = np.diff(values, axis=0)
+            steps = (steps + period // 2) % period - period // 2
+            values = values[0] + np.concatenate((np.zeros((1,) + values.shape[1:]), np.cumsum(steps, axis=0)))
+        return values
+
+    ### windowed statistics, per sensor of the channel, wrapping counters unwrapped. nan when the window is empty
+    def mean(self, name, n=None, seconds=None):
+        values = self._values(name, n, seconds)
+        return values.mean(axis=0) if len(values) else np.nan
+
+    def median(self, name, n=None, seconds=None):
+        values = self._values(name, n, seconds)
+        return np.median(values, axis=0) if len(values) else np.nan
+
+    def min(self, name, n=None, seconds=None):
+        values = self._values(name, n, seconds)
+        return values.min(axis=0) if len(values) else np.nan
+
+    def max(self, name, n=None, seconds=None):
+        values = self._values(name, n, seconds)
+        return values.max(axis=0) if len(values) else np.nan
+
+    def derivative(self, name, n=None, seconds=None):
+        """Rate of change per second over the window, least squares slope against the arrival timestamps."""
+        with self._lock:   # values and timestamps from the same packets
+            values = self._values(name, n, seconds)
+            times = self.window_timestamps(n, seconds)
+        if (len(values) < 2): return np.nan
+        times = times - times.mean()
+        spread = np.dot(times, times)
+        if (spread == 0): return np.nan
+        return np.tensordot(times, values - values.mean(axis=0), axes=(0, 0)) / spread
@@ -49,6 +49,56 @@ def diff_drive_inverse_kin(distance_mm, speed_mm_s, omega_rad):
     return left_speed_steps, right_speed_steps, left_steps, right_steps
 
 
+def _mm_to_steps_array(mm):
+    # helper.mm_to_steps with the same float operations, int() is truncation toward zero
+    rad = mm / helper.WHEEL_RADIUS_MM
+    return np.trunc((rad * helper.STEPS_PER_REVOLUTION) / (2 * math.pi)).astype(np.int64)
+
+
+def diff_drive_inverse_kin_batch(distance_mm, speed_mm_s, omega_rad):
+    """
+    diff_drive_inverse_kin for arrays of segments (e.g., every segment of a set of motion plans) in one pass.
+    Arguments broadcast against each other, results are identical to the scalar function per segment.
+
+    :param distance_mm: distances to be travelled
+    :param speed_mm_s: signed speeds, negative if moving backwards
+    :param omega_rad: angles of turn
+    :return: int64 arrays left wheel speed, right wheel speed (in steps), total_left_steps, total_right_steps
+    """
+    distance_mm, speed_mm_s, omega_rad = np.broadcast_arrays(np.asarray(distance_mm, dtype=float),
+                                                             np.asarray(speed_mm_s, dtype=float),
+                                                             np.asarray(omega_rad, dtype=float))
+    axle_radius = helper.AXLE_LENGTH_MM / 2
+    turn_in_place = distance_mm == 0
+    positive_turn = omega_rad > 0
+
+    with np.errstate(divide="ignore", invalid="ignore"):  # each branch is computed for every segment, then selected
+        # turn in place
+        spin_velocity_rad = np.abs(speed_mm_s) / (helper.AXLE_LENGTH_MM / 2)
+        spin_speed_mm = spin_velocity_rad * axle_radius
+        spin_left_speed_mm = np.where(positive_turn, -spin_speed_mm, spin_speed_mm)
+        spin_right_speed_mm = np.where(positive_turn, spin_speed_mm, -spin_speed_mm)
+
+        # drive along an arc
+        time_s = np.abs(distance_mm / speed_mm_s)
+        angular_velocity_rad = np.where(time_s != 0, omega_rad / time_s, 0)
+        omega_axle_half = omega_rad * axle_radius
+        distance_abs = np.abs(distance_mm)
+        non_negative_turn = omega_rad >= 0
+
+        left_speed_mm = np.where(turn_in_place, spin_left_speed_mm, speed_mm_s - angular_velocity_rad * axle_radius)
+        right_speed_mm = np.where(turn_in_place, spin_right_speed_mm, speed_mm_s + angular_velocity_rad * axle_radius)
+        left_distance_mm = np.where(turn_in_place, -omega_rad * axle_radius,
+                                    np.where(non_negative_turn, distance_abs - omega_axle_half,
+                                             distance_abs + omega_axle_half))
+        right_distance_mm = np.where(turn_in_place, omega_rad * axle_radius,
+                                     np.where(non_negative_turn, distance_abs + omega_axle_half,
+                                              distance_abs - omega_axle_half))
+
+    return (_mm_to_steps_array(left_speed_mm), _mm_to_steps_array(right_speed_mm),
+            _mm_to_steps_array(left_distance_mm), _mm_to_steps_array(right_distance_mm))
+
+
 if __name__ == "__main__":
     test_cases = [
         (130, 10, 0, (75, 75, 978, 978)),
@@ -67,3 +117,8 @@ if __name__ == "__main__":
         print(f"Test Case #{idx}:")
         print(f"Expected: {expected}")
         print(f"Actual:   {actual}\n")
+
+    distances, speeds, omegas, expected = zip(*test_cases)
+    batch = np.stack(diff_drive_inverse_kin_batch(distances, speeds, omegas), axis=1)
+    scalar = np.array([diff_drive_inverse_kin(*case) for case in zip(distances, speeds, omegas)])
+    print(f"Batch matches the scalar results: {np.array_equal(batch, scalar)}")
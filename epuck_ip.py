@@ -2,6 +2,8 @@ import socket
 import select
 import epuck
 import time
+import threading
+from epuck_packets import CommandPacket, StreamFramer
 
 class EPuckIP(epuck.EPuck):
 
@@ -20,44 +22,96 @@ class EPuckIP(epuck.EPuck):
     
     _isOpen = False  # IP doesn't have a clear concept of open/closed. We manage ourself and set to close on failure to push for reconnect
 
-    def __init__(self, ip, port=1000, debug=False, timeout=10): #timeout in s
+    # camera frames hold up the sensor packets behind them on the link, see epuck_bandwidth.StreamPolicy to duty cycle
+    #  the camera stream at a frame rate or byte budget instead of leaving it on.
+    # background: drain and frame the stream on a reader thread. data_update then only applies the newest
+    #  sensor packet and frame, never blocks, and stale packets are dropped instead of parsed.
+    def __init__(self, ip, port=1000, debug=False, timeout=10, background=False): #timeout in s
         super().__init__(debug, timeout)
         self._port = port
         self._ip = ip 
         self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._connect_attempted = False
+        self._command = CommandPacket(header=[self._CMD_COMMAND_PACKET, 0x00])
+
+        self._background = background
+        self._receiver = None
+        # newest (seq, timestamp, data) published by the reader thread. replaced as a whole, so no lock needed
+        self._latest_sensors = None
+        self._latest_frame = None   # newest Frame not yet applied
+        self._frame_lock = threading.Lock()
+        self._receiving_frame = None  # Frame the framer is receiving a camera packet into
+        self._frame_start = None      # tracer time the camera packet started to come in, when tracing
+        self._received_sensors = 0
+        self.get_camera_parameters()  # fixed in IP mode, set now so camera packets can always be framed
+        self._get_frame_pool()
+        self._framer = StreamFramer({self._CMD_CAMERA_PACKET: self.cam_framebytes,
+                                     self._CMD_SENSOR_PACKET: epuck._RESPONSE_PACKET_LEN,
+                                     self._CMD_EMPTY_PACKET: 0},
+                                    direct={self._CMD_CAMERA_PACKET: self._camera_sink})
 
 
 
     ### COMM methods
     def  _internal_connect(self):
+        if (self._connect_attempted): self._new_stream()   # reconnect, a socket can only be connected once
+        self._connect_attempted = True
         try:
             self._socket.connect((self._ip, self._port))
             self._isOpen = True
             self._socket.settimeout(self._timeout)
+            if (self._background): self._start_receiver()
             return True
         except Exception as e:
-            self._debug_print(f"Failed to connect: {e}")
+            self._debug_print("Failed to connect: %s", e)
             self._isOpen = False
             return False
 
+    #fresh socket and empty receive state, nothing from the old connection carries over
+    def _new_stream(self):
+        self._isOpen = False
+        if (self._receiver is not None):
+            self._receiver.join()
+            self._receiver = None
+        self._socket.close()
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._framer.reset()
+        if (self._receiving_frame is not None): self.frame_pool.release(self._receiving_frame)
+        self._receiving_frame = None
+        self._latest_sensors = None
+        with self._frame_lock:
+            frame, self._latest_frame = self._latest_frame, None
+        if (frame is not None): self.frame_pool.release(frame)
+        self._camera_enabled = self._sensors_enabled = False  # streams have to be requested again
+        self._command.dirty = True
+
     def is_connected(self):
         return self._isOpen
 
     def close(self):
-        self._socket.close()
         self._isOpen = False
+        if (self._receiver is not None):
+            self._receiver.join()
+            self._receiver = None
+        self._socket.close()
 
-    def _dataAvailable(self):
-        avail = select.select([self._socket], [], [self._socket], 0)  #poll mode
+    def _dataAvailable(self, timeout=0):  #default is poll mode
+        avail = select.select([self._socket], [], [self._socket], timeout)
         return avail[0] != [] 
 
     def _writeData(self, packet):
-        self._socket.sendall(packet)
+        try:
+            self._socket.sendall(packet)
+        except ConnectionError:  # dropped by the robot, same as a closed read
+            self._isOpen = False
  
     def _readData(self, size): #blocking
         data = bytearray()
         while len(data) < size:
-            newData = self._socket.recv(size-len(data))
+            try:
+                newData = self._socket.recv(size-len(data))
+            except ConnectionError:
+                newData = b''
             if (len(newData) == 0):  # empty received data means closed port <-- not true when in non blocking
                 self._isOpen = False
                 return bytearray()
@@ -90,44 +144,109 @@ class EPuckIP(epuck.EPuck):
           
     #request and update data on all active systems
     def data_update(self):
-        
+        tracer = self.tracer
+        if (tracer is not None): start = tracer.now()
+        self._sync_streams()
+        if (self._receiver is not None):
+            self._apply_latest()
+        else:
+            while (self._isOpen and self._dataAvailable()):
+                self._receive()
+        if (self._update_listeners): self._notify_update()
+        if (tracer is not None): tracer.complete("data_update", start)
+
+    def apply_stream_settings(self):
+        self._sync_streams()
+
+    def _sync_streams(self):
         if  ( (self.enable_camera != self._camera_enabled) or   #ensure requested streams match what user wants
             (self.enable_sensors != self._sensors_enabled) ):
             self.send_command()
-            
-    
-        while (self._dataAvailable()):
-            data = self._readData(1)  #get command byte
-            match data[0]:
+
+    #one large recv_into, then handle every complete packet it brought in
+    def _receive(self):
+        try:
+            count = self._framer.receive(self._socket)
+        except ConnectionError:
+            count = 0
+        if (count == 0):  # empty received data means closed port
+            self._isOpen = False
+            return
+        timestamp = time.monotonic()
+        for kind, payload in self._framer.packets():
+            match kind:
                 case self._CMD_CAMERA_PACKET:
-                    response = self._readData(self.cam_framebytes)
-                    self.sens_framebuffer = response
+                    frame, self._receiving_frame = self._receiving_frame, None
+                    if (frame is None):
+                        self.frame_pool.dropped += 1  # pool exhausted
+                        continue
+                    if (self.tracer is not None and self._frame_start is not None):
+                        self.tracer.complete("frame_receive", self._frame_start)
+                    self._frame_received(frame, timestamp)
                 
                 case self._CMD_SENSOR_PACKET:
-                    response = self._readData(epuck._RESPONSE_PACKET_LEN)
-                    self._parse_sensors_packet(response)
+                    self._sensors_received(payload, timestamp)
                 
                 case self._CMD_EMPTY_PACKET:
                     pass
                 
                 case _:
-                    self._debug_print("unexpected packet signature "+str(data[0]))
+                    if (self._debug): self._debug_print("unexpected packet signature %d", kind)
     
     
+    #where the framer puts the next camera payload: straight into a pool frame
+    def _camera_sink(self):
+        self._receiving_frame = self.frame_pool.acquire()
+        self._frame_start = self.tracer.now() if self.tracer is not None else None
+        if (self._receiving_frame is None): return None
+        return self._receiving_frame.buffer
+
+    ### background receive
+    def _start_receiver(self):
+        self._receiver = threading.Thread(target=self._receive_loop, name=f"EPuckIP {self._ip} receiver", daemon=True)
+        self._receiver.start()
+
+    def _receive_loop(self):
+        try:
+            while (self._isOpen):
+                if (self._dataAvailable(0.1)): self._receive()
+        except (OSError, ValueError) as e:   # socket closed under us
+            self._debug_print("receiver stopped: %s", e)
+            self._isOpen = False
+
+    #with the reader thread running, packets are only published here and applied in data_update
+    def _sensors_received(self, packet, timestamp):
+        if (self._receiver is None): return super()._sensors_received(packet, timestamp)
+        if (self._listeners): self._notify_sensors(packet, timestamp)
+        self._received_sensors += 1
+        self._latest_sensors = (self._received_sensors, timestamp, bytes(packet))  # copy out of the receive buffer
+
+    def _frame_received(self, frame, timestamp):
+        if (self._receiver is None): return super()._frame_received(frame, timestamp)
+        self.frame_pool.stamp(frame, timestamp)
+        if (self._listeners): self._notify_frame(frame)
+        with self._frame_lock:
+            skipped, self._latest_frame = self._latest_frame, frame
+        if (skipped is not None): self.frame_pool.release(skipped)  # never applied, newer one is in
+
+    def _apply_latest(self):  #O(1), only the newest packet is parsed
+        latest = self._latest_sensors
+        if (latest is not None and latest[0] != self.sensors_seq):
+            self.sensors_seq, self.sensors_timestamp, packet = latest
+            self._parse_sensors_packet(packet)
+        with self._frame_lock:
+            frame, self._latest_frame = self._latest_frame, None
+        if (frame is not None): self._set_frame(frame)
+
     ### internal packet packing and unpacking methods
     # protocol taken from https://www.gctronic.com/doc/index.php?title=e-puck2_PC_side_development#WiFi_2
     def _make_command_packet(self):
 
-        command_core = self._make_command_packet_core()
         request = 0x00
         if (self.enable_camera): request |= self._CMD_CAMERA_STREAM_BIT 
         if (self.enable_sensors): request |= self._CMD_SENSORS_STREAM_BIT 
         
-        # add IP specific command header
-        command = bytearray([
-            self._CMD_COMMAND_PACKET,
-            request
-        ])
-        command.extend(command_core)
-        return command
-    
\ No newline at end of file
+        # IP specific command header is part of the persistent packet, only the request byte changes
+        self._command.set_header_byte(1, request)
+        self._command.update(self.state)
+        return self._command.buffer
@@ -0,0 +1,208 @@
+import asyncio
+import time
+import epuck
+from epuck_packets import CommandPacket
+
+# asyncio version of EPuckIP. connect, data_update, send_command, stop_all and close are coroutines, and a reader task
+# per robot parses the incoming stream into the state as it arrives. One event loop can drive many robots, e.g.,
+#
+#   await asyncio.gather(*(robot.data_update() for robot in robots))
+
+class EPuckIPAsync(epuck.EPuck):
+
+    ### Constants and commands specific to IP communication, same protocol as EPuckIP
+    #Internal constants
+    _CMD_COMMAND_PACKET = 0x80
+    _CMD_CAMERA_PACKET = 0x01
+    _CMD_SENSOR_PACKET = 0x02
+    _CMD_EMPTY_PACKET = 0x03
+    _CMD_CAMERA_STREAM_BIT = 0x01
+    _CMD_SENSORS_STREAM_BIT = 0x02
+
+    #internal state
+    _camera_enabled = False
+    _sensors_enabled = False
+
+    _isOpen = False
+
+    def __init__(self, ip, port=1000, debug=False, timeout=10): #timeout in s
+        super().__init__(debug, timeout)
+        self._port = port
+        self._ip = ip
+        self._reader = None
+        self._writer = None
+        self._reader_task = None
+        self._sensors_event = asyncio.Event()  # set, and replaced, on every sensor packet
+        self._command = CommandPacket(header=[self._CMD_COMMAND_PACKET, 0x00])
+        self.get_camera_parameters()  # fixed in IP mode, the reader task needs the frame size
+
+
+    ### COMM methods
+    async def connect(self):
+        tracer = self.tracer
+        if (tracer is not None): start = tracer.now()
+        self._debug_print("attempting to connect")
+        connected = await self._internal_connect()
+        if (tracer is not None): tracer.complete("connect", start, {"connected": connected})
+        if (not connected):
+            self._debug_print("failed to connect")
+            return False
+        self._debug_print("connected")
+        return True
+
+    async def _internal_connect(self):
+        try:
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self._ip, self._port), self._timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            self._debug_print("Failed to connect: %s", e)
+            self._isOpen = False
+            return False
+        self._isOpen = True
+        self._reader_task = asyncio.create_task(self._receive_loop())
+        return True
+
+    def is_connected(self):
+        return self._isOpen
+
+    async def close(self):
+        if (self._reader_task is not None):
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except asyncio.CancelledError:
+                pass
+        if (self._writer is not None):
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except ConnectionError:
+                pass
+        self._isOpen = False
+
+    async def _writeData(self, packet):
+        self._writer.write(bytes(packet))  # copy, the command packet buffer is reused
+        await self._writer.drain()
+
+    async def _readData(self, size): #waits until the whole packet is in
+        return await self._reader.readexactly(size)
+
+    ### Robot Level Commands
+    def set_camera_parameters(self, mode=epuck.CAM_MODE_RGB565, width=160, height=120, zoom=1):
+        self._debug_print("error- cannot set camera parameters in IP mode, ignoring")
+
+    def get_camera_parameters(self):
+        ## For IP connection camera is not configurable so we need to hard code the numbers
+        (self.cam_mode, self.cam_width, self.cam_height, self.cam_zoom, self.cam_framebytes) = \
+            (epuck.CAM_MODE_RGB565, 160, 120, 1, 38400)   ##QQVGA, zoom 1
+
+    async def send_command(self):
+        song_command = not (self.act_speaker_sound == epuck.SOUND_NOCHANGE or self.act_speaker_sound == epuck.SOUND_STOP)
+        await self._send_command_once()
+        if (song_command): await self._send_command_once()  # same IP protocol song bug as EPuckIP
+        self._camera_enabled = self.enable_camera # remember our set state
+        self._sensors_enabled = self.enable_sensors
+
+    async def _send_command_once(self):
+        tracer = self.tracer
+        if (tracer is not None): start = tracer.now()
+        packet = self._make_command_packet()
+        if (self.skip_unchanged_commands and not self._command_pending()):
+            if (self._debug): self._debug_print("command unchanged, not sent")
+        else:
+            if (self._debug): self._debug_print("sending command")
+            await self._writeData(packet)
+            if (self._command_listeners): self._notify_command(packet)
+            self._command.mark_sent()
+            if (self._debug): self._debug_print("command sent")
+        self.act_speaker_sound = epuck.SOUND_NOCHANGE
+        if (tracer is not None): tracer.complete("send_command", start)
+
+    async def stop_all(self):
+        self.state.stop_all()
+        self._debug_print("issuing stop command")
+        await self.send_command()
+        await asyncio.sleep(2)  #give the robot time to get it, it's common to close right after
+
+    #the reader task keeps the state current, so this only makes sure the requested streams match what user wants
+    async def data_update(self):
+        tracer = self.tracer
+        if (tracer is not None): start = tracer.now()
+        if  ( (self.enable_camera != self._camera_enabled) or
+            (self.enable_sensors != self._sensors_enabled) ):
+            await self.send_command()
+        if (self._reader_task is not None and self._reader_task.done()):
+            self._isOpen = False
+        if (self._update_listeners): self._notify_update()
+        if (tracer is not None): tracer.complete("data_update", start)
+
+    #wait for the next sensor packet to be parsed. returns False on timeout (s)
+    async def wait_sensors(self, timeout=None):
+        try:
+            await asyncio.wait_for(self._sensors_event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _receive_loop(self):
+        try:
+            while True:
+                header = await self._readData(1)  #get command byte
+                match header[0]:
+                    case self._CMD_CAMERA_PACKET:
+                        tracer = self.tracer
+                        if (tracer is not None): start = tracer.now()
+                        data = await self._readData(self.cam_framebytes)
+                        frame = self._get_frame_pool().acquire()
+                        if (frame is not None):
+                            frame.buffer[:] = data
+                            if (tracer is not None): tracer.complete("frame_receive", start)
+                            self._frame_received(frame, time.monotonic())
+                        else: self.frame_pool.dropped += 1  # pool exhausted
+
+                    case self._CMD_SENSOR_PACKET:
+                        packet = await self._readData(epuck._RESPONSE_PACKET_LEN)
+                        self._sensors_received(packet, time.monotonic())
+                        event, self._sensors_event = self._sensors_event, asyncio.Event()
+                        event.set()
+
+                    case self._CMD_EMPTY_PACKET:
+                        pass
+
+                    case _:
+                        if (self._debug): self._debug_print("unexpected packet signature %d", header[0])
+        except (asyncio.IncompleteReadError, ConnectionError) as e:  # stream closed by the robot
+            self._debug_print("connection lost: %s", e)
+            self._isOpen = False
+
+    ### internal packet packing and unpacking methods
+    # protocol taken from https://www.gctronic.com/doc/index.php?title=e-puck2_PC_side_development#WiFi_2
+    def _make_command_packet(self):
+        request = 0x00
+        if (self.enable_camera): request |= self._CMD_CAMERA_STREAM_BIT
+        if (self.enable_sensors): request |= self._CMD_SENSORS_STREAM_BIT
+
+        self._command.set_header_byte(1, request)
+        self._command.update(self.state)
+        return self._command.buffer
+
+
+# Example: drive several robots from one event loop
+if __name__ == "__main__":
+    async def main(ips):
+        robots = [EPuckIPAsync(ip) for ip in ips]
+        connected = await asyncio.gather(*(robot.connect() for robot in robots))
+        robots = [robot for robot, ok in zip(robots, connected) if ok]
+        for robot in robots:
+            robot.enable_sensors = True
+
+        for i in range(50):
+            await asyncio.gather(*(robot.data_update() for robot in robots))
+            for robot in robots:
+                print(robot._ip, robot.state.sens_left_motor_steps, robot.state.sens_right_motor_steps)
+            await asyncio.sleep(0.1)
+
+        await asyncio.gather(*(robot.stop_all() for robot in robots))
+        await asyncio.gather(*(robot.close() for robot in robots))
+
+    asyncio.run(main(["172.20.10.2", "172.20.10.3"]))
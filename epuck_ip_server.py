@@ -0,0 +1,346 @@
+import random
+import select
+import socket
+import struct
+import threading
+import time
+from collections import deque
+from epuck_packets import SENSORS_PACKET, SENSORS_PACKET_LEN, COMMAND_CORE_LEN
+
+# Local stand-in for the e-puck2 WiFi protocol, for load testing EPuckIP with no robot.
+#
+# Accepts 0x80 command packets and, while their camera/sensor stream bits are set, streams 0x02 sensor packets and
+# 0x01 camera packets at the configured rates. A command with neither bit set is answered with a 0x03 empty packet.
+# Faults can be injected: latency and jitter on every outgoing packet, partial writes (each packet sent in small
+# chunks) and disconnects after a while, optionally mid packet or as a connection reset.
+#
+#   server = EPuckIPServer(sensor_hz=200, camera_hz=15, latency=0.01, jitter=0.002)
+#   port = server.start()
+#   robot = EPuckIP("127.0.0.1", port)
+#   ...
+#   server.stop()
+#
+# The sensor packets carry what a test needs to measure the link: the motor step counters integrate the commanded
+# speeds (so command to effect latency shows up), and the packet sequence number is in the first two mic words
+# (low, high 16 bits), with sent_time(seq) its time.monotonic() send time. Camera frames carry their number in the
+# first 4 bytes.
+
+_CMD_COMMAND_PACKET = 0x80
+_CMD_CAMERA_PACKET = 0x01
+_CMD_SENSOR_PACKET = 0x02
+_CMD_EMPTY_PACKET = 0x03
+_CMD_CAMERA_STREAM_BIT = 0x01
+_CMD_SENSORS_STREAM_BIT = 0x02
+
+_COMMAND_PACKET_LEN = 2 + COMMAND_CORE_LEN
+_MOTOR_SPEEDS = struct.Struct("<hh")
+_FRAME_NUMBER = struct.Struct("<I")
+_SENT_TIMES = 1 << 16   # sensor send times kept for sent_time()
+
+# value indices into SENSORS_PACKET
+_MIC_0 = 30
+_MIC_1 = 31
+_TOF = 29
+_LEFT_MOTOR = 34
+_RIGHT_MOTOR = 35
+_BATTERY = 36
+
+
+class EPuckIPServer():
+
+    def __init__(self, host="127.0.0.1", port=0, sensor_hz=50, camera_hz=10, empty_hz=0, cam_framebytes=38400,
+                 latency=0.0, jitter=0.0, max_chunk=0, chunk_gap=0.0, disconnect_after=None, disconnect_mid_packet=False,
+                 disconnect_reset=False, seed=None, debug=False):
+        """
+        Args:
+            host, port: address to listen on, port 0 picks a free port (returned by start()).
+            sensor_hz, camera_hz: stream rates while requested. 0 sends as fast as the connection takes them.
+            empty_hz: rate of unsolicited empty packets, 0 for none.
+            cam_framebytes: camera payload size, 38400 for the QQVGA RGB565 frames of the robot.
+            latency: seconds each packet is held back before it is sent.
+            jitter: standard deviation of the extra delay per packet, in seconds. Packets stay in order.
+            max_chunk: when > 0, packets are written in random chunks of 1 to max_chunk bytes (partial writes).
+            chunk_gap: seconds between those chunks.
+            disconnect_after: drop each connection this many seconds after it was accepted, None to keep it.
+            disconnect_mid_packet: drop in the middle of a packet instead of between packets.
+            disconnect_reset: drop with a TCP reset instead of a normal close.
+            seed: random seed for repeatable jitter and chunking.
+        """
+        self.host = host
+        self.port = port
+        self.sensor_hz = sensor_hz
+        self.camera_hz = camera_hz
+        self.empty_hz = empty_hz
+        self.cam_framebytes = cam_framebytes
+        self.latency = latency
+        self.jitter = jitter
+        self.max_chunk = max_chunk
+        self.chunk_gap = chunk_gap
+        self.disconnect_after = disconnect_after
+        self.disconnect_mid_packet = disconnect_mid_packet
+        self.disconnect_reset = disconnect_reset
+        self._random = random.Random(seed)
+        self._debug = debug
+
+        #statistics, over all connections. the client threads update them holding _lock
+        self.connections = 0
+        self.disconnects = 0          # connections dropped by fault injection
+        self.commands_received = 0
+        self.sensors_sent = 0
+        self.frames_sent = 0
+        self.empty_sent = 0
+        self.bytes_sent = 0
+
+        self._sent_times = [0.0]*_SENT_TIMES
+        self._listener = None
+        self._thread = None
+        self._clients = []
+        self._running = False
+        self._lock = threading.Lock()
+
+    def _debug_print(self, msg, *args):
+        if(self._debug): print(self.__class__.__name__+": "+(msg % args if args else msg))
+
+    #start listening and serving on background threads. returns the port
+    def start(self):
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind((self.host, self.port))
+        self._listener.listen()
+        self.port = self._listener.getsockname()[1]
+        self._running = True
+        self._thread = threading.Thread(target=self._accept_loop, name="EPuckIPServer", daemon=True)
+        self._thread.start()
+        self._debug_print("listening on %s:%d", self.host, self.port)
+        return self.port
+
+    def stop(self):
+        self._running = False
+        if (self._thread is not None):
+            self._thread.join()
+            self._thread = None
+        self._listener.close()
+        with self._lock:
+            clients, self._clients = self._clients, []
+        for client in clients: client.join()
+
+    #time.monotonic() at which sensor packet seq was sent, None if not (or no longer) known
+    def sent_time(self, seq):
+        with self._lock:
+            if (seq <= 0 or seq > self.sensors_sent or self.sensors_sent - seq >= _SENT_TIMES): return None
+            return self._sent_times[seq % _SENT_TIMES]
+
+    #drop every current connection now
+    def drop_clients(self):
+        with self._lock:
+            for client in self._clients: client.drop_now = True
+
+    def _accept_loop(self):
+        while (self._running):
+            if (not select.select([self._listener], [], [], 0.1)[0]): continue
+            try:
+                conn, address = self._listener.accept()
+            except OSError:
+                continue
+            with self._lock:
+                self.connections += 1
+            self._debug_print("connection from %s", address)
+            client = _Client(self, conn)
+            with self._lock:
+                self._clients = [c for c in self._clients if c.thread.is_alive()] + [client]
+            client.thread.start()
+
+
+class _Client():
+    """One connection, served on its own thread."""
+
+    def __init__(self, server, conn):
+        self.server = server
+        self.conn = conn
+        self.drop = False       # stop serving
+        self.drop_now = False   # fault injected disconnect
+        self.thread = threading.Thread(target=self.serve, name="EPuckIPServer client", daemon=True)
+
+        self._received = bytearray()
+        self._request = 0
+        self._speeds = (0, 0)
+        self._steps = [0.0, 0.0]
+        self._steps_time = time.monotonic()
+        self._frame_count = 0
+        self._queue = deque()   # (send at, packet) held back by the injected latency
+        self._last_due = 0.0
+        self._frame_packet = bytearray(1 + server.cam_framebytes)
+        self._frame_packet[0] = _CMD_CAMERA_PACKET
+        self._frame_packet[1:] = bytes(range(256)) * (server.cam_framebytes // 256) + bytes(server.cam_framebytes % 256)
+
+    def join(self):
+        self.drop = True
+        self.thread.join()
+
+    def serve(self):
+        server, conn = self.server, self.conn
+        now = time.monotonic()
+        drop_at = now + server.disconnect_after if server.disconnect_after is not None else None
+        next_sensors = next_camera = next_empty = now
+        try:
+            while (server._running and not self.drop):
+                now = time.monotonic()
+                if (self.drop_now or (drop_at is not None and now >= drop_at)): return self._disconnect()
+
+                #wait for a command or the next thing to send
+                wake = [drop_at or now + 0.1, now + 0.1]
+                if (self._queue): wake.append(self._queue[0][0])
+                if (self._request & _CMD_SENSORS_STREAM_BIT): wake.append(next_sensors)
+                if (self._request & _CMD_CAMERA_STREAM_BIT): wake.append(next_camera)
+                if (server.empty_hz): wake.append(next_empty)
+                timeout = max(0.0, min(wake) - now)
+                if (select.select([conn], [], [], timeout)[0]):
+                    data = conn.recv(4096)
+                    if (not data): return   # client closed
+                    self._commands(data)
+
+                now = time.monotonic()
+                if (self._request & _CMD_SENSORS_STREAM_BIT and now >= next_sensors):
+                    self._queue_packet(now, self._sensor_packet(now))
+                    next_sensors = self._next(next_sensors, now, server.sensor_hz)
+                if (self._request & _CMD_CAMERA_STREAM_BIT and now >= next_camera):
+                    self._queue_packet(now, self._camera_packet())
+                    next_camera = self._next(next_camera, now, server.camera_hz)
+                if (server.empty_hz and now >= next_empty):
+                    self._queue_packet(now, bytes([_CMD_EMPTY_PACKET]))
+                    next_empty = self._next(next_empty, now, server.empty_hz)
+
+                while (self._queue and self._queue[0][0] <= time.monotonic()):
+                    self._send(self._queue.popleft()[1])
+        except OSError as e:   # client went away
+            server._debug_print("connection ended: %s", e)
+        finally:
+            conn.close()
+
+    #next send time of a stream, without bursting to catch up after a stall
+    def _next(self, scheduled, now, hz):
+        if (not hz): return now
+        scheduled += 1 / hz
+        return scheduled if scheduled > now else now + 1 / hz
+
+    def _commands(self, data):
+        received = self._received
+        received.extend(data)
+        while (received):
+            if (received[0] != _CMD_COMMAND_PACKET):   # out of sync, skip a byte
+                del received[0]
+                continue
+            if (len(received) < _COMMAND_PACKET_LEN): return
+            self._command(received[:_COMMAND_PACKET_LEN])
+            del received[:_COMMAND_PACKET_LEN]
+
+    def _command(self, packet):
+        with self.server._lock:
+            self.server.commands_received += 1
+        now = time.monotonic()
+        self._integrate(now)
+        self._request = packet[1]
+        self._speeds = _MOTOR_SPEEDS.unpack_from(packet, 3)   # header 2 bytes, then the core, speeds at 1
+        if (not self._request & (_CMD_SENSORS_STREAM_BIT | _CMD_CAMERA_STREAM_BIT)):
+            self._queue_packet(now, bytes([_CMD_EMPTY_PACKET]))
+
+    def _integrate(self, now):
+        dt = now - self._steps_time
+        self._steps_time = now
+        self._steps[0] += self._speeds[0] * dt
+        self._steps[1] += self._speeds[1] * dt
+
+    def _sensor_packet(self, now):
+        self._integrate(now)
+        server = self.server
+        with server._lock:   # sensors_sent is also the sequence number, unique across the clients
+            server.sensors_sent += 1
+            seq = server.sensors_sent
+        values = [0]*46
+        values[_MIC_0] = seq & 0xFFFF
+        values[_MIC_1] = (seq >> 16) & 0xFFFF
+        values[_TOF] = 2000
+        values[_LEFT_MOTOR] = int(self._steps[0]) & 0xFFFF
+        values[_RIGHT_MOTOR] = int(self._steps[1]) & 0xFFFF
+        values[_BATTERY] = 4000
+        packet = bytearray(1 + SENSORS_PACKET_LEN)
+        packet[0] = _CMD_SENSOR_PACKET
+        SENSORS_PACKET.pack_into(packet, 1, *values)
+        return (seq, packet)
+
+    def _camera_packet(self):
+        self._frame_count += 1
+        _FRAME_NUMBER.pack_into(self._frame_packet, 1, self._frame_count)
+        with self.server._lock:
+            self.server.frames_sent += 1
+        return bytes(self._frame_packet)  # the shared packet changes with the next frame, queue a copy
+
+    def _queue_packet(self, now, packet):
+        server = self.server
+        due = now + server.latency
+        if (server.jitter): due += abs(server._random.gauss(0, server.jitter))
+        due = max(due, self._last_due)   # keep the stream in order
+        self._last_due = due
+        self._queue.append((due, packet))
+
+    def _send(self, packet):
+        server, conn = self.server, self.conn
+        seq = None
+        if (isinstance(packet, tuple)): seq, packet = packet
+        with server._lock:
+            if (packet[0] == _CMD_EMPTY_PACKET): server.empty_sent += 1
+            if (seq is not None): server._sent_times[seq % _SENT_TIMES] = time.monotonic()
+
+        if (not server.max_chunk):
+            conn.sendall(packet)
+        else:
+            view = memoryview(packet)
+            while (view):
+                count = server._random.randint(1, server.max_chunk)
+                conn.sendall(view[:count])
+                view = view[count:]
+                if (view and server.chunk_gap): time.sleep(server.chunk_gap)
+        with server._lock:
+            server.bytes_sent += len(packet)
+
+    def _disconnect(self):
+        server, conn = self.server, self.conn
+        with server._lock:
+            server.disconnects += 1
+        if (server.disconnect_mid_packet):
+            packet = self._queue[0][1] if self._queue else self._sensor_packet(time.monotonic())
+            if (isinstance(packet, tuple)): packet = packet[1]
+            conn.sendall(packet[:len(packet) // 2])
+        if (server.disconnect_reset):
+            conn.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))   # close sends RST
+        server._debug_print("dropping connection")
+
+
+if __name__ == "__main__":
+    from epuck_ip import EPuckIP
+
+    server = EPuckIPServer(sensor_hz=200, camera_hz=15, latency=0.005, jitter=0.001)
+    port = server.start()
+    robot = EPuckIP("127.0.0.1", port)
+    robot.connect()
+    robot.enable_sensors = True
+    robot.enable_camera = True
+
+    start = time.monotonic()
+    latencies = []
+    while (time.monotonic() - start < 3):
+        seq = robot.sensors_seq
+        robot.data_update()
+        if (robot.sensors_seq != seq):
+            sent = server.sent_time(robot.state.sens_mic_volume[0] | robot.state.sens_mic_volume[1] << 16)
+            if (sent is not None): latencies.append(robot.sensors_timestamp - sent)
+        time.sleep(0.001)
+    elapsed = time.monotonic() - start
+    robot.close()
+    server.stop()
+
+    latencies.sort()
+    print(f"{robot.sensors_seq / elapsed:.0f} sensor packets/s, {robot.frame_seq / elapsed:.1f} frames/s, "
+          f"{server.bytes_sent / elapsed / 1e6:.2f} MB/s")
+    if (latencies):
+        print(f"latency p50 {latencies[len(latencies)//2]*1000:.2f} ms, p99 {latencies[len(latencies)*99//100]*1000:.2f} ms")
@@ -1,7 +1,7 @@
 import time
 import numpy as np
 import matplotlib.pyplot as plt
-from epuck_open_loop_forward_kinematics import diff_drive_forward_kin
+from epuck_odometry import OdometryEngine
 from epuck_simple_open_loop_controller import move_straight
 
 # Task 5: Measure Open-loop Trajectories
@@ -21,23 +21,21 @@ def measure_trajectory(epuck, distance_mm, speed_mm_s, Hz, trials=10):
     """
     errors = []
     theoretical_pose = (0, distance_mm, 0)  # Ideal final pose
+    odometry = OdometryEngine()
+    epuck.add_listener(odometry)
 
     for trial in range(trials):
         print(f"Trial {trial + 1}/{trials}:")
 
-        # Reset initial pose
-        initial_pose = (0, 0, 0)
-        epuck.state.sens_left_motor_steps = 0
-        epuck.state.sens_right_motor_steps = 0
+        # Reset initial pose, odometry starts from the next sensor packet
+        odometry.reset((0, 0, 0))
 
         # Move the robot
         final_distance = move_straight(epuck, distance_mm, Hz)
         print(f"  Distance moved: {final_distance:.2f} mm")
 
-        # Get the final pose (odometry)
-        final_pose = diff_drive_forward_kin(initial_pose,
-                                            epuck.state.sens_left_motor_steps,
-                                            epuck.state.sens_right_motor_steps)
+        # Get the final pose (odometry, integrated per sensor packet during the move)
+        final_pose = odometry.pose
 
         # Calculate errors
         err_x = final_pose[0] - theoretical_pose[0]
@@ -48,6 +46,7 @@ def measure_trajectory(epuck, distance_mm, speed_mm_s, Hz, trials=10):
 
         time.sleep(2)  # Wait before the next trial
 
+    epuck.remove_listener(odometry)
     return errors
 
 # Plot errors
@@ -0,0 +1,169 @@
+# Motion execution with latency compensated stops.
+#
+# A controller that stops a wheel once a sensor packet shows its target was passed always overshoots: the packet is
+# already one sensor latency old, the check waits for the next loop tick, and the stop command takes a command latency
+# to reach the motors. StepTargetExecutor instead predicts when each wheel will cross its target from the recent step
+# samples and sends the stop one round trip latency ahead of that, sleeping inside the loop period for the exact send
+# time when the crossing falls between two ticks.
+#
+#   executor = StepTargetExecutor(robot, l_speed, r_speed, l_target, r_target)
+#   executor.start()
+#   loop = RateLoop(Hz, clock=robot)
+#   while not executor.done():
+#       robot.data_update()
+#       executor.update()
+#       executor.stop_wheels(loop.period)   # stops due before the next tick are sent now, at their exact times
+#       loop.wait()
+#
+# The round trip latency (command out to movement showing in the sensors) is measured from the start command: each
+# sample of a moving wheel extrapolates the movement onset back from its arrival time, and the latency is the running
+# minimum of onset - start over the samples. A packet only gets its timestamp when data_update takes it in, so single
+# estimates are late by however long it waited; the minimum drops that wait. The correction applied never exceeds one
+# loop period (the stop_wheels horizon).
+
+from epuck_helper_functions import steps_delta
+
+LEFT = 0
+RIGHT = 1
+
+
+class StepTargetExecutor():
+
+    def __init__(self, robot, l_speed_steps_s, r_speed_steps_s, l_target_steps, r_target_steps, latency=None,
+                 compensate=True, window=5, settle_timeout=1.0):
+        """
+        Args:
+            robot: connected EPuck with sensors enabled.
+            l_speed_steps_s, r_speed_steps_s: wheel speeds in steps per second.
+            l_target_steps, r_target_steps: steps each wheel should move.
+            latency: round trip latency in s to use instead of measuring it during the move.
+            compensate: False stops a wheel once its target shows as passed, without prediction.
+            window: number of recent samples the wheel velocity is estimated from.
+            settle_timeout: most time in s to wait after the last stop for the wheels to be seen at rest.
+        """
+        self.robot = robot
+        self.speeds = [l_speed_steps_s, r_speed_steps_s]
+        self.targets = [abs(l_target_steps), abs(r_target_steps)]
+        self.latency = latency
+        self._measure = latency is None
+        self._max_correction = None   # the stop_wheels horizon, the most the stops are moved ahead
+        self.compensate = compensate
+        self.window = window
+        self.settle_timeout = settle_timeout
+
+        self.moved = [0, 0]           # steps moved per wheel (signed), as last seen
+        self.stopped = [False, False]  # stop command sent
+        self.stop_times = [None, None]
+        self._last_steps = [0, 0]     # raw 16 bit counters of the last packet, moved accumulates the wrapped deltas
+        self._samples = ([], [])      # recent (timestamp, abs steps moved) per wheel
+        self._start_time = None
+        self._sensors_seq = -1
+
+    @property
+    def left_moved(self): return self.moved[LEFT]
+
+    @property
+    def right_moved(self): return self.moved[RIGHT]
+
+    #take the start position from a fresh sensor packet, then send the wheel speeds
+    def start(self, timeout=1.0):
+        robot = self.robot
+        seq = robot.sensors_seq
+        give_up = robot.monotonic() + timeout
+        robot.data_update()
+        while (robot.sensors_seq == seq and robot.monotonic() < give_up):
+            robot.sleep(0.001)
+            robot.data_update()
+        self._last_steps = [robot.state.sens_left_motor_steps, robot.state.sens_right_motor_steps]
+        self.moved = [0, 0]
+        self._sensors_seq = robot.sensors_seq
+
+        for wheel in (LEFT, RIGHT):
+            if (self.targets[wheel] == 0 or self.speeds[wheel] == 0): self.stopped[wheel] = True
+        robot.state.act_left_motor_speed = 0 if self.stopped[LEFT] else self.speeds[LEFT]
+        robot.state.act_right_motor_speed = 0 if self.stopped[RIGHT] else self.speeds[RIGHT]
+        robot.send_command()
+        self._start_time = robot.monotonic()
+        for wheel in (LEFT, RIGHT):
+            if (self.stopped[wheel]): self.stop_times[wheel] = self._start_time
+
+    #take in the latest sensor packet, if there is a new one
+    def update(self):
+        robot = self.robot
+        if (robot.sensors_seq == self._sensors_seq): return
+        self._sensors_seq = robot.sensors_seq
+        timestamp = robot.sensors_timestamp
+        steps = (robot.state.sens_left_motor_steps, robot.state.sens_right_motor_steps)
+        for wheel in (LEFT, RIGHT):
+            self.moved[wheel] += steps_delta(self._last_steps[wheel], steps[wheel])   # counters wrap at 2**16
+            self._last_steps[wheel] = steps[wheel]
+            samples = self._samples[wheel]
+            samples.append((timestamp, abs(self.moved[wheel])))
+            if (len(samples) > self.window): del samples[0]
+            if (self._measure and self.moved[wheel] != 0 and not self.stopped[wheel]):
+                self._measure_latency(wheel, timestamp)
+
+    def _measure_latency(self, wheel, timestamp):
+        # movement started |moved|/speed before this sample, the start command went out at _start_time
+        onset = timestamp - abs(self.moved[wheel]) / abs(self.speeds[wheel])
+        estimate = max(0.0, onset - self._start_time)
+        if (self.latency is None or estimate < self.latency): self.latency = estimate
+
+    #latency the stops are moved ahead by, at most one loop period
+    def _correction(self):
+        latency = self.latency or 0.0
+        return latency if self._max_correction is None else min(latency, self._max_correction)
+
+    #wheel speed in steps/s from the recent samples (least squares), the commanded speed until there are enough
+    def velocity(self, wheel):
+        samples = self._samples[wheel]
+        moving = [sample for sample in samples if sample[1] > 0]
+        if (len(moving) < 3): return abs(self.speeds[wheel])
+        mean_t = sum(t for t, s in moving) / len(moving)
+        mean_s = sum(s for t, s in moving) / len(moving)
+        var_t = sum((t - mean_t)**2 for t, s in moving)
+        if (var_t == 0): return abs(self.speeds[wheel])
+        slope = sum((t - mean_t) * (s - mean_s) for t, s in moving) / var_t
+        return slope if slope > 0 else abs(self.speeds[wheel])
+
+    #when the stop for wheel has to be sent so the wheel stops on its target
+    def stop_time(self, wheel):
+        if (not self._samples[wheel]): return None
+        timestamp, moved = self._samples[wheel][-1]
+        remaining = self.targets[wheel] - moved
+        return timestamp + remaining / self.velocity(wheel) - self._correction()
+
+    def stop_wheels(self, horizon):
+        """Stop every wheel whose stop falls before now + horizon, sleeping until each exact stop time."""
+        robot = self.robot
+        self._max_correction = horizon
+        due = []
+        for wheel in (LEFT, RIGHT):
+            if (self.stopped[wheel]): continue
+            if (not self.compensate):
+                if (abs(self.moved[wheel]) >= self.targets[wheel]): due.append((robot.monotonic(), wheel))
+                continue
+            at = self.stop_time(wheel)
+            if (at is not None and at <= robot.monotonic() + horizon): due.append((at, wheel))
+
+        for at, wheel in sorted(due):
+            wait = at - robot.monotonic()
+            if (wait > 0): robot.sleep(wait)   # fine timed final command
+            self._stop(wheel)
+
+    def _stop(self, wheel):
+        robot = self.robot
+        self.stopped[wheel] = True
+        if (wheel == LEFT): robot.state.act_left_motor_speed = 0
+        else: robot.state.act_right_motor_speed = 0
+        robot.send_command()
+        self.stop_times[wheel] = robot.monotonic()
+
+    #both wheels stopped, and a sensor packet from after the stops took effect is in (or settle_timeout passed)
+    def done(self):
+        if (not all(self.stopped)): return False
+        last_stop = max(self.stop_times)
+        if (not self.compensate): return True
+        settled = last_stop + (self.latency or 0.0)
+        latest = max(samples[-1][0] if samples else 0.0 for samples in self._samples)
+        return latest > settled or self.robot.monotonic() > last_stop + self.settle_timeout
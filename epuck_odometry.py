@@ -0,0 +1,128 @@
+import bisect
+import math
+import struct
+import threading
+from epuck_helper_functions import steps_delta
+from epuck_open_loop_forward_kinematics import diff_drive_forward_kin
+from epuck_packets import MOTOR_STEPS_OFFSET
+
+# Odometry integrated on every sensor packet, at stream rate, instead of once per control tick.
+#
+#   odometry = OdometryEngine(initial_pose)
+#   robot.add_listener(odometry)     # with EPuckIP background receive this runs on the reader thread
+#   ...
+#   odometry.pose                    # latest pose
+#   odometry.pose_at(t)              # pose at time t (time.monotonic()), interpolated between packets
+#
+# Each packet's step counters go through steps_delta (16 bit wraparound) into diff_drive_forward_kin. The poses are
+# kept with their packet timestamps in a bounded history, so a slow planner can still ask where the robot was when,
+# e.g., a camera frame was taken.
+
+_MOTOR_STEPS = struct.Struct("<HH")
+
+
+class _History():
+    """Fixed capacity ring of (timestamp, x, y, theta), indexable oldest first so bisect works on it."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._items = [None] * capacity
+        self._start = 0
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, index):
+        if (index < 0): index += self._len
+        if (not 0 <= index < self._len): raise IndexError("pose history index out of range")
+        return self._items[(self._start + index) % self.capacity]
+
+    def append(self, item):
+        if (self._len < self.capacity):
+            self._items[(self._start + self._len) % self.capacity] = item
+            self._len += 1
+        else:
+            self._items[self._start] = item
+            self._start = (self._start + 1) % self.capacity
+
+    def clear(self):
+        self._start = self._len = 0
+
+
+class _Timestamps():
+    """Timestamp column of a _History, for bisect."""
+
+    def __init__(self, history):
+        self._history = history
+
+    def __len__(self):
+        return len(self._history)
+
+    def __getitem__(self, index):
+        return self._history[index][0]
+
+
+class OdometryEngine():
+
+    def __init__(self, initial_pose=(0, 0, 0), history=4096):
+        """
+        Args:
+            initial_pose: (x, y, theta) in mm and radians at the first sensor packet.
+            history: number of timestamped poses kept for pose_at.
+        """
+        self.pose = initial_pose
+        self.packets = 0
+        self.history = _History(history)
+        self._timestamps = _Timestamps(self.history)
+        self._last_steps = None
+        self._lock = threading.Lock()
+
+    #start over at pose, the next packet is the new reference
+    def reset(self, pose=(0, 0, 0)):
+        with self._lock:
+            self.pose = pose
+            self._last_steps = None
+            self.history.clear()
+
+    ### listener interface
+    def on_sensors(self, robot, packet, timestamp):
+        left, right = _MOTOR_STEPS.unpack_from(packet, MOTOR_STEPS_OFFSET)
+        self.update(left, right, timestamp)
+
+    def on_frame(self, robot, frame):
+        pass
+
+    #integrate one reading of the raw step counters
+    def update(self, left_steps, right_steps, timestamp):
+        with self._lock:
+            last = self._last_steps
+            self._last_steps = (left_steps, right_steps)
+            if (last is not None):
+                self.pose = diff_drive_forward_kin(self.pose, steps_delta(last[0], left_steps),
+                                                   steps_delta(last[1], right_steps))
+            self.packets += 1
+            self.history.append((timestamp,) + tuple(self.pose))
+
+    ### queries
+    def pose_at(self, t):
+        """
+        Pose at time t, linearly interpolated between the two packets around it (theta the short way round).
+        After the newest packet this is the newest pose, before the oldest one kept it is None.
+        """
+        with self._lock:
+            history = self.history
+            if (not len(history) or t < history[0][0]): return None
+            index = bisect.bisect_right(self._timestamps, t)
+            if (index == len(history)): return history[-1][1:]
+            t0, x0, y0, theta0 = history[index - 1]
+            t1, x1, y1, theta1 = history[index]
+        share = (t - t0) / (t1 - t0) if t1 > t0 else 1.0
+        turn = (theta1 - theta0 + math.pi) % (2 * math.pi) - math.pi
+        return (x0 + share * (x1 - x0), y0 + share * (y1 - y0), (theta0 + share * turn) % (2 * math.pi))
+
+    def time_range(self):
+        """(oldest, newest) timestamp in the history, None if empty."""
+        with self._lock:
+            if (not len(self.history)): return None
+            return self.history[0][0], self.history[-1][0]
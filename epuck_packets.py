@@ -0,0 +1,320 @@
+import struct
+import sys
+from array import array
+
+### Packet layouts shared by all com methods
+# protocol taken from https://www.gctronic.com/doc/index.php?title=e-puck2_PC_side_development#WiFi_2
+
+SENSORS_PACKET_LEN = 104        # sensor packet as sent over WiFi
+SENSORS_PACKET_COM_LEN = 103    # COM does not send the reserved byte at the end
+
+# Compiled once. The reserved trailing byte is left out so the same struct decodes both the IP and the COM packet.
+SENSORS_PACKET = struct.Struct("<"+   #epuck is in little endian
+        "3h"+  #accelerometer xes X Y Z
+        "3f"+  #acceleration, orientation, inclination
+        "3h"+   #gyro X Y Z axis values
+        "3f"+   #magnetometer X Y Z axes
+        "B"+   #Temperature in c
+        "HHHHHHHH"+ #proximity sensors
+        "HHHHHHHH"+ #ambient light sensors
+        "H"+    #tof
+        "HHHH" +    #microphones
+        "HH" +   #motors L/R
+        "H"  +   #battery level
+        "?"  +   #SD present
+        "xxx" +  # Rc5 TV protocol, ignored
+        "B" +   #selector
+        "HHH" + #ground proximity
+        "HHH" +  #ground ambient
+        "?")     #button
+
+#byte offsets of the channel groups inside the sensor packet
+_ACCELEROMETER_OFFSET = 0    # 3 x int16
+_MOTION_OFFSET = 6           # 3 x float: acceleration, orientation, inclination
+_GYRO_OFFSET = 18            # 3 x int16
+_MAGNETOMETER_OFFSET = 24    # 3 x float
+_TEMPERATURE_OFFSET = 36
+_WORDS_OFFSET = 37           # 24 x uint16: proximity, ambient, tof, mics, motors, battery are back to back
+_SD_OFFSET = 85
+_SELECTOR_OFFSET = 89
+_GROUND_OFFSET = 90          # 6 x uint16: ground proximity then ground ambient
+_BUTTON_OFFSET = 102
+
+#indices into the uint16 word block
+WORD_PROXIMITY = 0
+WORD_AMBIENT = 8
+WORD_TOF = 16
+WORD_MIC = 17
+WORD_LEFT_MOTOR = 21
+WORD_RIGHT_MOTOR = 22
+WORD_BATTERY = 23
+WORDS_COUNT = 24
+GROUND_COUNT = 6
+
+#byte offset of the left then right motor step counters, for reading them straight off a raw packet
+MOTOR_STEPS_OFFSET = _WORDS_OFFSET + 2*WORD_LEFT_MOTOR
+
+# the block copy fast path relies on the host using the same byte order as the robot
+_NATIVE_LITTLE_ENDIAN = sys.byteorder == "little"
+
+
+class SensorChannels():
+    """Preallocated per-channel buffers for one robot's sensor data.
+
+    The multi-value groups live in typed arrays that decode_sensors_into overwrites in place, so decoding a packet
+    never builds a tuple. sens_proximity, sens_ambient, sens_mic_volume, sens_ground_prox and sens_ground_amp are
+    memoryview windows onto those arrays and can be indexed like the lists they replace.
+    """
+
+    __slots__ = ("sens_accelerometer", "_motion", "sens_gyro", "sens_magnetometer", "sens_temperature",
+                 "_words", "sens_has_SD", "sens_selector_pos", "_ground", "sens_button_press",
+                 "sens_proximity", "sens_ambient", "sens_mic_volume", "sens_ground_prox", "sens_ground_amp",
+                 "_blocks")
+
+    def __init__(self):
+        self.sens_accelerometer = array('h', bytes(6))  #X Y Z
+        self._motion = array('f', bytes(12))            #acceleration, orientation, inclination
+        self.sens_gyro = array('h', bytes(6))           #X Y Z
+        self.sens_magnetometer = array('f', bytes(12))  #X Y Z
+        self.sens_temperature = 0
+        self._words = array('H', bytes(2*WORDS_COUNT))
+        self.sens_has_SD = False
+        self.sens_selector_pos = 0
+        self._ground = array('H', bytes(2*GROUND_COUNT))
+        self.sens_button_press = False
+
+        words = memoryview(self._words)
+        self.sens_proximity = words[WORD_PROXIMITY:WORD_AMBIENT]
+        self.sens_ambient = words[WORD_AMBIENT:WORD_TOF]
+        self.sens_mic_volume = words[WORD_MIC:WORD_LEFT_MOTOR]
+        ground = memoryview(self._ground)
+        self.sens_ground_prox = ground[:GROUND_COUNT//2]
+        self.sens_ground_amp = ground[GROUND_COUNT//2:]
+
+        #(start, end, byte view of destination) for each block copied straight from the packet
+        self._blocks = tuple(
+            (offset, offset + len(buf)*buf.itemsize, memoryview(buf).cast('B'))
+            for offset, buf in ((_ACCELEROMETER_OFFSET, self.sens_accelerometer),
+                                (_MOTION_OFFSET, self._motion),
+                                (_GYRO_OFFSET, self.sens_gyro),
+                                (_MAGNETOMETER_OFFSET, self.sens_magnetometer),
+                                (_WORDS_OFFSET, self._words),
+                                (_GROUND_OFFSET, self._ground)))
+
+    #pickle/copy support: the memoryview windows can't be pickled, so the state is every other slot (subclasses
+    #included) and the windows are rebuilt onto fresh arrays holding copies of the backing data
+    _VIEWS = ("sens_proximity", "sens_ambient", "sens_mic_volume", "sens_ground_prox", "sens_ground_amp", "_blocks")
+    _ARRAYS = ("sens_accelerometer", "_motion", "sens_gyro", "sens_magnetometer", "_words", "_ground")
+
+    def __getstate__(self):
+        state = {}
+        for cls in type(self).__mro__:
+            for name in getattr(cls, "__slots__", ()):
+                if (name not in self._VIEWS and hasattr(self, name)): state[name] = getattr(self, name)
+        return state
+
+    def __setstate__(self, state):
+        SensorChannels.__init__(self)
+        for name, value in state.items():
+            if (name in self._ARRAYS): getattr(self, name)[:] = value
+            else: setattr(self, name, value)
+
+    #scalar channels stored inside the arrays
+    @property
+    def sens_acceleration(self): return self._motion[0]
+    @sens_acceleration.setter
+    def sens_acceleration(self, value): self._motion[0] = value
+
+    @property
+    def sens_orientation(self): return self._motion[1]
+    @sens_orientation.setter
+    def sens_orientation(self, value): self._motion[1] = value
+
+    @property
+    def sens_inclination(self): return self._motion[2]
+    @sens_inclination.setter
+    def sens_inclination(self, value): self._motion[2] = value
+
+    @property
+    def sens_tof_distance_mm(self): return self._words[WORD_TOF]
+    @sens_tof_distance_mm.setter
+    def sens_tof_distance_mm(self, value): self._words[WORD_TOF] = value
+
+    @property
+    def sens_left_motor_steps(self): return self._words[WORD_LEFT_MOTOR]
+    @sens_left_motor_steps.setter
+    def sens_left_motor_steps(self, value): self._words[WORD_LEFT_MOTOR] = value
+
+    @property
+    def sens_right_motor_steps(self): return self._words[WORD_RIGHT_MOTOR]
+    @sens_right_motor_steps.setter
+    def sens_right_motor_steps(self, value): self._words[WORD_RIGHT_MOTOR] = value
+
+    @property
+    def sens_battery_mv(self): return self._words[WORD_BATTERY]
+    @sens_battery_mv.setter
+    def sens_battery_mv(self, value): self._words[WORD_BATTERY] = value
+
+
+def decode_sensors_into(packet, channels):
+    """Decode a sensor packet (IP or COM length, any buffer) straight into preallocated SensorChannels."""
+    view = memoryview(packet)
+    if _NATIVE_LITTLE_ENDIAN:
+        for start, end, dest in channels._blocks:
+            dest[:] = view[start:end]
+    else:
+        _decode_sensors_swapped(view, channels)
+    channels.sens_temperature = view[_TEMPERATURE_OFFSET]
+    channels.sens_has_SD = view[_SD_OFFSET] != 0
+    channels.sens_selector_pos = view[_SELECTOR_OFFSET]
+    channels.sens_button_press = view[_BUTTON_OFFSET] != 0
+
+
+def _decode_sensors_swapped(view, channels):  #big endian hosts, can't block copy
+    data = SENSORS_PACKET.unpack_from(view)
+    channels.sens_accelerometer[:] = array('h', data[0:3])
+    channels._motion[:] = array('f', data[3:6])
+    channels.sens_gyro[:] = array('h', data[6:9])
+    channels.sens_magnetometer[:] = array('f', data[9:12])
+    channels._words[:] = array('H', data[13:37])
+    channels._ground[:] = array('H', data[39:45])
+
+
+COMMAND_CORE_LEN = 19   # settings, motors, binary leds, rgb leds, speaker
+
+_MOTORS = struct.Struct("<hh")   #left, right speed, 16 bit little endian
+_RGB = struct.Struct("12B")      #LED2, LED4, LED6, LED8 as r, g, b
+
+
+class CommandPacket():
+    """Persistent actuator command buffer.
+
+    The com method specific header and trailer are written once. update() only re-packs the fields of the
+    19 byte core that changed since the last call, and dirty tells if anything changed since mark_sent().
+    """
+
+    __slots__ = ("buffer", "_core", "_speeds", "_leds", "_rgb", "_sound", "dirty")
+
+    def __init__(self, header=b"", trailer=b""):
+        self.buffer = bytearray(header) + bytearray(COMMAND_CORE_LEN) + bytearray(trailer)
+        self._core = len(header)  # offset of the core in the buffer. core byte 0 is settings, left at 0
+        self._speeds = self._leds = self._rgb = self._sound = None
+        self.dirty = True
+
+    def set_header_byte(self, index, value):
+        if self.buffer[index] != value:
+            self.buffer[index] = value
+            self.dirty = True
+
+    def update(self, state):
+        core = self._core
+        speeds = (int(state.act_left_motor_speed), int(state.act_right_motor_speed))
+        if speeds != self._speeds:
+            _MOTORS.pack_into(self.buffer, core+1, *speeds)
+            self._speeds = speeds
+            self.dirty = True
+
+        leds = state.act_binary_led_states
+        if leds != self._leds:
+            led_bits = 0x00
+            for i, on in enumerate(leds):
+                if on: led_bits = led_bits | (1 << i)
+            self.buffer[core+5] = led_bits
+            self._leds = list(leds)   # copy, the state list is changed in place
+            self.dirty = True
+
+        colors = state.act_rgb_led_colors
+        if colors != self._rgb:
+            _RGB.pack_into(self.buffer, core+6, *colors[0], *colors[1], *colors[2], *colors[3])
+            self._rgb = list(colors)
+            self.dirty = True
+
+        if state.act_speaker_sound != self._sound:
+            self._sound = self.buffer[core+18] = state.act_speaker_sound
+            self.dirty = True
+
+    def mark_sent(self):
+        self.dirty = False
+
+
+class StreamFramer():
+    """Frames the IP packet stream (1 byte type then a fixed size payload) out of a reusable receive buffer.
+
+    receive() does one large recv_into, packets() then yields every complete (type, payload) in the buffer, with the
+    payload as a memoryview into it. A payload is only valid until the next receive(), copy it to keep it. Unknown
+    packet types are yielded with a None payload and skipped one byte at a time.
+
+    direct maps a packet type to a callable returning a writable buffer of the payload size (or None to use the
+    receive buffer). Those payloads are received straight into that buffer, which is what packets() yields for them.
+    """
+
+    def __init__(self, payload_sizes, capacity=1 << 17, direct=None):
+        self._sizes = dict(payload_sizes)   # packet type -> payload bytes
+        self._direct = dict(direct or {})
+        capacity = max(capacity, 2*(max(self._sizes.values()) + 1))  # always room for a whole packet
+        self._buffer = bytearray(capacity)
+        self._view = memoryview(self._buffer)
+        self._start = 0  # first byte not yet framed
+        self._end = 0    # end of received data
+        self._pending = None  # [type, destination buffer, its memoryview, bytes filled] of a direct payload
+
+    def buffered(self):
+        return self._end - self._start
+
+    #drop everything buffered, e.g., after a reconnect. returns the destination of an unfinished direct payload, if any
+    def reset(self):
+        pending, self._pending = self._pending, None
+        self._start = self._end = 0
+        return pending[1] if pending is not None else None
+
+    # one recv_into as large as the free space. returns bytes read, 0 when the connection is closed
+    def receive(self, sock):
+        pending = self._pending
+        if (pending is not None):   # rest of a direct payload goes straight to its destination
+            count = sock.recv_into(pending[2][pending[3]:])
+            pending[3] += count
+            return count
+        if (self._start == self._end):
+            self._start = self._end = 0
+        elif (len(self._buffer) - self._end < len(self._buffer) // 2):   # running out, move the partial packet to the front
+            pending = self._end - self._start
+            self._view[:pending] = self._view[self._start:self._end]
+            self._start, self._end = 0, pending
+        count = sock.recv_into(self._view[self._end:])
+        self._end += count
+        return count
+
+    def packets(self):
+        pending = self._pending
+        if (pending is not None):
+            if (pending[3] < len(pending[2])): return
+            self._pending = None
+            yield pending[0], pending[1]
+
+        buffer, view, sizes, direct = self._buffer, self._view, self._sizes, self._direct
+        while (self._start < self._end):
+            start = self._start
+            kind = buffer[start]
+            size = sizes.get(kind)
+            if (size is None):
+                self._start = start + 1
+                yield kind, None
+                continue
+
+            sink = direct.get(kind)
+            destination = sink() if sink is not None else None
+            if (destination is not None):
+                dest_view = memoryview(destination)
+                available = min(self._end - start - 1, size)
+                dest_view[:available] = view[start+1:start+1+available]
+                self._start = start + 1 + available
+                if (available < size):
+                    self._pending = [kind, destination, dest_view, available]
+                    return
+                yield kind, destination
+                continue
+
+            end = start + 1 + size
+            if (end > self._end): return   # incomplete, wait for more data
+            self._start = end
+            yield kind, view[start+1:end]
@@ -0,0 +1,111 @@
+import time
+from collections import deque
+
+# Fixed rate control loops with absolute deadlines.
+#
+# Sleeping 1/Hz after the loop body makes every period 1/Hz plus however long the body took, so the real rate drifts
+# below Hz. RateLoop instead keeps a grid of absolute deadlines start + k/Hz and sleeps only for what is left of the
+# current period.
+#
+#   loop = RateLoop(Hz, clock=robot)   # robot.monotonic()/robot.sleep(), so it also runs on simulated time
+#   while running:
+#       ... body ...
+#       loop.wait()
+#   print(loop.report())
+#
+# When the body overruns a deadline the policy decides what happens next:
+#   CATCH_UP  keep the original grid, the next periods run back to back until the loop is on schedule again, so the
+#             number of ticks over a long run stays exact.
+#   SKIP      drop the deadlines already missed and continue on the next grid slot, so a tick never comes early but
+#             missed ticks are lost (counted in skipped).
+
+CATCH_UP = "catch_up"
+SKIP = "skip"
+
+
+class _WallClock():
+    monotonic = staticmethod(time.monotonic)
+    sleep = staticmethod(time.sleep)
+
+
+class RateLoop():
+
+    def __init__(self, hz, clock=None, policy=SKIP, history=1024):
+        """
+        Args:
+            hz: loop rate.
+            clock: object with monotonic() and sleep(seconds), e.g., the EPuck being controlled. Wall time by default.
+            policy: CATCH_UP or SKIP, what to do after an overrun.
+            history: number of recent periods kept for the statistics.
+        """
+        if (policy not in (CATCH_UP, SKIP)): raise ValueError(f"unknown policy {policy}")
+        self.hz = hz
+        self.period = 1 / hz
+        self.policy = policy
+        self._clock = clock if clock is not None else _WallClock()
+        self._periods = deque(maxlen=history)
+        self.reset()
+
+    #start a new grid at now, and clear the statistics
+    def reset(self):
+        now = self._clock.monotonic()
+        self.ticks = 0
+        self.missed = 0       # deadlines the body overran
+        self.skipped = 0      # deadlines dropped by the SKIP policy
+        self.overrun = 0.0    # how late the last wait() was called, 0 if on time
+        self._start = now
+        self._deadline = now + self.period
+        self._last_tick = now
+        self._periods.clear()
+
+    def wait(self):
+        """Sleep until the next deadline. Returns True if it was met, False if the body overran it."""
+        clock = self._clock
+        now = clock.monotonic()
+        late = now - self._deadline
+        on_time = late <= 0
+        if (on_time):
+            self.overrun = 0.0
+            clock.sleep(-late)
+            self._deadline += self.period
+        else:
+            self.missed += 1
+            self.overrun = late
+            if (self.policy == SKIP):
+                behind = int(late // self.period) + 1   # grid slots that have already gone by
+                self.skipped += behind - 1
+                self._deadline += behind * self.period
+                clock.sleep(self._deadline - now)
+                self._deadline += self.period
+            else:
+                self._deadline += self.period   # no sleep, the next deadline may already be due too
+
+        now = clock.monotonic()
+        self._periods.append(now - self._last_tick)
+        self._last_tick = now
+        self.ticks += 1
+        return on_time
+
+    ### statistics
+    def percentile(self, p):
+        """p-th percentile (0..100, nearest rank) of the recent periods, in seconds."""
+        if (not self._periods): return 0.0
+        periods = sorted(self._periods)
+        return periods[min(len(periods) - 1, max(0, round(p / 100 * len(periods)) - 1))]
+
+    def achieved_hz(self):
+        elapsed = self._last_tick - self._start
+        return self.ticks / elapsed if elapsed > 0 else 0.0
+
+    def stats(self):
+        periods = self._periods
+        return {"hz": self.hz, "achieved_hz": self.achieved_hz(), "ticks": self.ticks, "missed": self.missed,
+                "skipped": self.skipped, "period_mean": sum(periods) / len(periods) if periods else 0.0,
+                "period_p50": self.percentile(50), "period_p99": self.percentile(99),
+                "period_max": max(periods) if periods else 0.0}
+
+    def report(self):
+        s = self.stats()
+        return (f"{s['achieved_hz']:.1f}/{self.hz} Hz over {s['ticks']} ticks, period p50 {s['period_p50']*1000:.1f} ms "
+                f"p99 {s['period_p99']*1000:.1f} ms max {s['period_max']*1000:.1f} ms, {s['missed']} missed deadlines, "
+                f"{s['skipped']} skipped")
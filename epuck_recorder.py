@@ -0,0 +1,129 @@
+import mmap
+import os
+import struct
+import threading
+from epuck_packets import SENSORS_PACKET_LEN
+
+# Raw telemetry recording. A recording is two fixed record binary files next to each other:
+#   <path>.sensors  raw sensor packets
+#   <path>.frames   raw camera frames, only if the camera was on
+# Each file is a 32 byte header then fixed size records of a little endian float64 host timestamp (time.monotonic())
+# followed by the payload, padded to 8 bytes. Fixed records make the files trivially memory mappable, record i is at
+# HEADER + i * record_size, e.g., numpy.memmap(path, dtype=[("t", "<f8"), ("payload", "u1", record_size-8)],
+# offset=32).
+#
+#   recorder = TelemetryRecorder("run1")
+#   robot.add_listener(recorder)
+#   ...
+#   recorder.close()
+#
+# and play it back with epuck_replay.EPuckReplay("run1").
+
+SENSORS_SUFFIX = ".sensors"
+FRAMES_SUFFIX = ".frames"
+
+_MAGIC = b"EPUCKREC"
+_VERSION = 1
+_HEADER = struct.Struct("<8sIIhHH10x")   # magic, version, payload bytes, cam mode, cam width, cam height
+_TIMESTAMP = struct.Struct("<d")
+HEADER_LEN = _HEADER.size
+
+
+def _record_size(payload_bytes):
+    return _TIMESTAMP.size + (payload_bytes + 7) // 8 * 8
+
+
+class RecordWriter():
+    """Appends fixed size (timestamp, payload) records to one recording file."""
+
+    def __init__(self, path, payload_bytes, cam_mode=-1, cam_width=0, cam_height=0):
+        self.payload_bytes = payload_bytes
+        self.count = 0
+        self._record = bytearray(_record_size(payload_bytes))   # reused for every record
+        self._file = open(path, "wb")
+        self._file.write(_HEADER.pack(_MAGIC, _VERSION, payload_bytes, cam_mode, cam_width, cam_height))
+
+    def append(self, timestamp, payload):
+        record = self._record
+        _TIMESTAMP.pack_into(record, 0, timestamp)
+        end = _TIMESTAMP.size + len(payload)
+        record[_TIMESTAMP.size:end] = payload
+        if (end < len(record)): record[end:] = bytes(len(record) - end)   # shorter COM packet, zero pad
+        self._file.write(record)
+        self.count += 1
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class RecordFile():
+    """Read only memory map of one recording file."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path) else b""
+        if (len(self._map) < HEADER_LEN):
+            raise ValueError(f"{path} is not a telemetry recording")
+        magic, version, self.payload_bytes, self.cam_mode, self.cam_width, self.cam_height = \
+            _HEADER.unpack_from(self._map)
+        if (magic != _MAGIC or version != _VERSION):
+            raise ValueError(f"{path} is not a version {_VERSION} telemetry recording")
+        self.record_size = _record_size(self.payload_bytes)
+        self._view = memoryview(self._map)
+        self._count = (len(self._map) - HEADER_LEN) // self.record_size   # a partly written last record is ignored
+
+    def __len__(self):
+        return self._count
+
+    def timestamp(self, index):
+        return _TIMESTAMP.unpack_from(self._map, HEADER_LEN + index*self.record_size)[0]
+
+    def payload(self, index):  #memoryview into the map, no copy. copy it (bytes()) to keep it past close()
+        start = HEADER_LEN + index*self.record_size + _TIMESTAMP.size
+        return self._view[start:start + self.payload_bytes]
+
+    #payloads still referenced elsewhere keep the map alive: it is then unmapped once the last of them is gone
+    def close(self):
+        if (self._view is None): return
+        self._view.release()
+        self._view = None
+        if (isinstance(self._map, mmap.mmap)):
+            try:
+                self._map.close()
+            except BufferError:
+                pass   # dropping our reference leaves the unmap to the last payload slice
+        self._map = None
+
+
+class TelemetryRecorder():
+    """EPuck listener that records every raw sensor packet and camera frame with its host timestamp."""
+
+    def __init__(self, path):
+        self.path = path
+        self._sensors = RecordWriter(path + SENSORS_SUFFIX, SENSORS_PACKET_LEN)
+        self._frames = None   # opened on the first frame, when the camera parameters are known
+        self._lock = threading.Lock()   # a background receiver and the user thread may both hit the recorder
+
+    def on_sensors(self, robot, packet, timestamp):
+        with self._lock:
+            self._sensors.append(timestamp, packet)
+
+    def on_frame(self, robot, frame):
+        with self._lock:
+            if (self._frames is None):
+                self._frames = RecordWriter(self.path + FRAMES_SUFFIX, robot.cam_framebytes,
+                                            robot.cam_mode, robot.cam_width, robot.cam_height)
+            self._frames.append(frame.timestamp, frame.buffer)
+
+    def flush(self):
+        with self._lock:
+            self._sensors.flush()
+            if (self._frames is not None): self._frames.flush()
+
+    def close(self):
+        with self._lock:
+            self._sensors.close()
+            if (self._frames is not None): self._frames.close()
@@ -0,0 +1,134 @@
+import os
+import time
+import epuck
+from epuck_packets import CommandPacket
+from epuck_recorder import RecordFile, SENSORS_SUFFIX, FRAMES_SUFFIX
+
+# Plays an epuck_recorder recording back through the EPuck interface, so controllers can be re-run and benchmarked
+# against recorded data without a robot. Commands are accepted but have no effect on the data.
+#
+# realtime=False: every data_update delivers the next sensor packet, with any recorded at the same time, and the frames
+#  recorded up to it, as fast as the caller goes. The robot clock (monotonic/sleep) is virtual: sleep advances it without waiting, and a
+#  data_update after a sleep delivers everything recorded up to the new time.
+# realtime=True: data_update delivers everything recorded up to the time elapsed since connect, times speed.
+# Either way, packets carry their recorded timestamps and monotonic() is on the same recorded timeline, so
+#  controllers comparing the two (e.g., epuck_motion.StepTargetExecutor) behave as on the robot.
+# is_connected() turns False at the end of the recording.
+
+class EPuckReplay(epuck.EPuck):
+
+    def __init__(self, path, realtime=False, speed=1.0, debug=False):
+        super().__init__(debug)
+        self._path = path
+        self.realtime = realtime
+        self.speed = speed
+        self._sensors = None
+        self._frames = None
+        self._isOpen = False
+        self._command = CommandPacket()
+        self.last_command = None   # last command packet "sent", for inspection
+        self._now = 0.0                 # virtual clock, realtime=False
+        self._start_wall = time.monotonic()
+        self._start_recorded = 0.0
+
+    ### COMM methods
+    def _internal_connect(self):
+        try:
+            self._sensors = RecordFile(self._path + SENSORS_SUFFIX)
+            if (os.path.exists(self._path + FRAMES_SUFFIX)):
+                self._frames = RecordFile(self._path + FRAMES_SUFFIX)
+        except (OSError, ValueError) as e:
+            self._debug_print("Failed to open recording: %s", e)
+            return False
+        self.get_camera_parameters()
+        self._next_sensors = 0
+        self._next_frame = 0
+        self._start_wall = time.monotonic()
+        self._start_recorded = self._first_timestamp()
+        self._now = self._start_recorded
+        self._isOpen = True
+        return True
+
+    def is_connected(self):
+        return self._isOpen
+
+    def close(self):
+        if (self._sensors is not None): self._sensors.close()
+        if (self._frames is not None): self._frames.close()
+        self._sensors = self._frames = None
+        self._isOpen = False
+
+    def _writeData(self, packet):
+        self.last_command = bytes(packet)
+
+    def _readData(self, size):  #next recorded sensor packet, empty at the end
+        if (self._next_sensors >= len(self._sensors)): return bytearray()
+        self._next_sensors += 1
+        return bytearray(self._sensors.payload(self._next_sensors - 1)[:size])
+
+    ### Robot Level Commands
+    def set_camera_parameters(self, mode=epuck.CAM_MODE_RGB565, width=160, height=120, zoom=1):
+        self._debug_print("error- cannot set camera parameters of a recording, ignoring")
+
+    def get_camera_parameters(self):
+        if (self._frames is None): return
+        (self.cam_mode, self.cam_width, self.cam_height, self.cam_zoom, self.cam_framebytes) = \
+            (self._frames.cam_mode, self._frames.cam_width, self._frames.cam_height, 1, self._frames.payload_bytes)
+
+    def data_update(self):
+        if (not self._isOpen): return
+        sensors = self._sensors
+        if (self.realtime):
+            until = self._start_recorded + (time.monotonic() - self._start_wall) * self.speed
+            while (self._next_sensors < len(sensors) and sensors.timestamp(self._next_sensors) <= until):
+                self._deliver_frames(sensors.timestamp(self._next_sensors))
+                self._deliver_sensors()
+            self._deliver_frames(until)
+        elif (self._next_sensors < len(sensors)):
+            self._now = max(self._now, sensors.timestamp(self._next_sensors))
+            while (self._next_sensors < len(sensors) and sensors.timestamp(self._next_sensors) <= self._now):
+                self._deliver_frames(sensors.timestamp(self._next_sensors))
+                self._deliver_sensors()
+        else:
+            self._deliver_frames(float("inf"))
+
+        if (self._next_sensors >= len(sensors) and (self._frames is None or self._next_frame >= len(self._frames))):
+            self._debug_print("end of recording")
+            self._isOpen = False
+        if (self._update_listeners): self._notify_update()
+
+    #the robot clock runs on the recorded timeline, the one the packet timestamps are on
+    def monotonic(self):
+        if (self.realtime): return self._start_recorded + (time.monotonic() - self._start_wall) * self.speed
+        return self._now
+
+    def sleep(self, seconds):
+        if (seconds <= 0): return
+        if (self.realtime): time.sleep(seconds / self.speed)
+        else: self._now += seconds
+
+    def _deliver_sensors(self):
+        index = self._next_sensors
+        self._next_sensors += 1
+        self._sensors_received(self._sensors.payload(index), self._sensors.timestamp(index))
+
+    def _deliver_frames(self, until):  #all frames recorded up to until
+        frames = self._frames
+        if (frames is None): return
+        while (self._next_frame < len(frames) and frames.timestamp(self._next_frame) <= until):
+            index = self._next_frame
+            self._next_frame += 1
+            frame = self._get_frame_pool().acquire()
+            if (frame is None):
+                self.frame_pool.dropped += 1
+                continue
+            frame.buffer[:] = frames.payload(index)
+            self._frame_received(frame, frames.timestamp(index))
+
+    def _first_timestamp(self):
+        first = [records.timestamp(0) for records in (self._sensors, self._frames) if records is not None and len(records)]
+        return min(first) if first else 0.0
+
+    def _make_command_packet(self):
+        self._command.update(self.state)
+        return self._command.buffer
@@ -3,6 +3,8 @@ import random
 from epuck_com import EPuckCom
 from epuck_ip import EPuckIP
 import epuck  #for user constants
+import epuck_camera
+from epuck_rate import RateLoop
 
 import numpy as np
 from PIL import Image
@@ -12,14 +14,7 @@ import matplotlib.pyplot as plt
 def cam_bytes_to_image(mode, data, width, height):
 
     if (mode == epuck.CAM_MODE_RGB565):
-        npdata = np.frombuffer(data, dtype=">i2")    # camera is big endian, 16 bit per pixel.
-        npdata = npdata.astype(np.uint32)            #expand to 32 bit to make room for unpacking.
-        alpha = 0xFF000000     #ALPHA is MSB, all set to 1
-        r = ((npdata & 0xF800) >> 8)    # mask out top 5 bits, then shift right to make it the LSB of the 32 bit
-        g = ((npdata & 0x07E0) << 5)         # mask out middle 6 bits, then shift a little left to make it the 2nd LSB
-        b = ((npdata & 0x001F) << 19)        # mask out the bottom 5 bits, then shift it all the way left to be the 3rd LSB
-        arr = alpha + r + g + b
-        return Image.frombuffer('RGBA', (width, height), arr, 'raw', 'RGBA', 0, 1)  
+        return Image.fromarray(epuck_camera.rgb565_to_rgb(data, width, height), 'RGB')
 
     if (mode == epuck.CAM_MODE_GREY):
         npdata = np.frombuffer(data, np.uint8)    # camera is big endian, 16 bit per pixel.
@@ -47,6 +42,7 @@ def epuck_test():
     # epuckcomm.send_command()
     # time.sleep(5)
 
+    loop = RateLoop(10, clock=epuckcomm)
     for i in range(100):
         epuckcomm.state.act_binary_led_states[random.randint(0,epuck.BINARY_LED_COUNT-1)] = random.randint(0,1)
         epuckcomm.state.act_rgb_led_colors[random.randint(0,epuck.RGB_LED_COUNT-1)] = (random.randint(0,100), random.randint(0,100), random.randint(0,100))
@@ -64,7 +60,8 @@ def epuck_test():
             plt.pause(0.000001)
         
         print(str(epuckcomm.state.sens_tof_distance_mm) + " steps L/R: "+ str(epuckcomm.state.sens_left_motor_steps) + "/" + str(epuckcomm.state.sens_right_motor_steps))
-        time.sleep(0.1) #100hz roughly
+        loop.wait() #10hz
+    print(loop.report())
     time.sleep(2)
 
     epuckcomm.stop_all()
@@ -0,0 +1,171 @@
+import random
+import struct
+import time
+from collections import deque
+import epuck
+from epuck_packets import CommandPacket, SENSORS_PACKET
+from epuck_open_loop_forward_kinematics import diff_drive_forward_kin
+
+# Simulated e-puck for testing and benchmarking controllers without hardware.
+#
+# Motor speed commands take effect after a configurable latency, the wheel step counters integrate the speeds (with
+# optional noise) and the pose follows diff_drive_forward_kin. Everything runs on a SimClock, which by default is
+# stepped: robot.sleep() advances virtual time instantly, so a controller that paces itself with robot.sleep runs as
+# fast as the host can go. e.g.,
+#
+#   robot = EPuckSim(latency=0.05, step_noise=0.02)
+#   robot.connect()
+#   robot.enable_sensors = True
+#   move_straight(robot, 500, 0)
+#   print(robot.pose)
+
+class SimClock():
+    """Virtual clock. time_scale=None is stepped, time only moves with sleep/advance. Otherwise virtual time runs at
+    time_scale times wall time."""
+
+    def __init__(self, time_scale=None):
+        self.time_scale = time_scale
+        self._now = 0.0
+        self._wall_origin = time.monotonic()
+
+    def time(self):
+        if (self.time_scale is None): return self._now
+        return self._now + (time.monotonic() - self._wall_origin) * self.time_scale
+
+    def sleep(self, seconds):
+        if (seconds <= 0): return
+        if (self.time_scale is None): self._now += seconds
+        else: time.sleep(seconds / self.time_scale)
+
+    def advance(self, seconds):  #stepped clocks only
+        self._now += seconds
+
+
+class EPuckSim(epuck.EPuck):
+
+    _STEP_COUNTER_MODULO = 1 << 16   #motor step counters are reported as 16 bit, like the robot
+    _MOTOR_SPEED = struct.Struct("<hh")
+
+    def __init__(self, initial_pose=(0, 0, 0), clock=None, latency=0.0, latency_jitter=0.0, step_noise=0.0,
+                 seed=None, debug=False):
+        """
+        Args:
+            initial_pose: (x, y, theta) in mm and radians.
+            clock: SimClock to run on, a new stepped clock by default.
+            latency: seconds from send_command until the motors change speed.
+            latency_jitter: standard deviation of the latency, in seconds.
+            step_noise: standard deviation of the relative error on each integrated wheel step increment.
+            seed: random seed for repeatable noise.
+        """
+        super().__init__(debug)
+        self.sim_clock = clock if clock is not None else SimClock()
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.step_noise = step_noise
+        self._random = random.Random(seed)
+        self._command = CommandPacket()
+        self._isOpen = False
+
+        self.pose = initial_pose   # true pose of the simulated robot
+        self.tof_distance_mm = 2000
+        self._steps = [0.0, 0.0]   # true wheel steps, left right
+        self._speeds = (0, 0)      # motor speeds in effect, steps/s
+        self._pending = deque()    # (time, left speed, right speed) commands still in flight
+        self._sim_time = self.sim_clock.time()
+
+    ### time
+    def sleep(self, seconds):
+        self.sim_clock.sleep(seconds)
+
+    def monotonic(self):
+        return self.sim_clock.time()
+
+    ### COMM methods
+    def _internal_connect(self):
+        self._sim_time = self.sim_clock.time()
+        self._isOpen = True
+        return True
+
+    def is_connected(self):
+        return self._isOpen
+
+    def close(self):
+        self._isOpen = False
+
+    def _writeData(self, packet):  #only the motor speeds have an effect
+        left, right = self._MOTOR_SPEED.unpack_from(packet, 1)
+        delay = self.latency
+        if (self.latency_jitter): delay = max(0.0, self._random.gauss(delay, self.latency_jitter))
+        apply_at = self.sim_clock.time() + delay
+        if (self._pending and apply_at < self._pending[-1][0]): apply_at = self._pending[-1][0]  # stays in order
+        self._pending.append((apply_at, left, right))
+
+    def _readData(self, size):  #a sensor packet of the simulated state, now
+        self._step_to(self.sim_clock.time())
+        values = [0]*46
+        values[29] = self.tof_distance_mm
+        values[34] = int(self._steps[0]) % self._STEP_COUNTER_MODULO
+        values[35] = int(self._steps[1]) % self._STEP_COUNTER_MODULO
+        values[36] = 4000  #battery mv
+        packet = bytearray(SENSORS_PACKET.pack(*values))
+        packet.extend(bytes(size - len(packet)))
+        return packet
+
+    def data_update(self):
+        if (self.enable_sensors):
+            self._sensors_received(self._readData(epuck._RESPONSE_PACKET_LEN), self.sim_clock.time())
+        else:
+            self._step_to(self.sim_clock.time())
+        if (self._update_listeners): self._notify_update()
+
+    ### Robot Level Commands
+    def set_camera_parameters(self, mode=epuck.CAM_MODE_RGB565, width=160, height=120, zoom=1):
+        self._debug_print("error- simulated robot has no camera, ignoring")
+
+    def get_camera_parameters(self):
+        pass
+
+    ### simulation
+    def _step_to(self, t):
+        while (self._pending and self._pending[0][0] <= t):
+            apply_at, left, right = self._pending.popleft()
+            self._integrate(apply_at)
+            self._speeds = (left, right)
+        self._integrate(t)
+
+    def _integrate(self, t):
+        dt = t - self._sim_time
+        if (dt <= 0): return
+        self._sim_time = t
+        left = self._speeds[0] * dt
+        right = self._speeds[1] * dt
+        if (self.step_noise):
+            left *= 1 + self._random.gauss(0, self.step_noise)
+            right *= 1 + self._random.gauss(0, self.step_noise)
+        self._steps[0] += left
+        self._steps[1] += right
+        self.pose = diff_drive_forward_kin(self.pose, left, right)
+
+    def _make_command_packet(self):
+        self._command.update(self.state)
+        return self._command.buffer
+
+
+if __name__ == "__main__":
+    from epuck_complex_behaviour import move_straight
+    import math
+
+    # forward, backward (the step counters wrap below 0) and a turn in place, each checked against the true pose
+    for distance, omega, speed, expected in ((500, 0, 70, (500, 0, 0)), (-130, 0, -100, (-130, 0, 0)),
+                                             (0, math.pi, 30, (0, 0, math.pi))):
+        robot = EPuckSim(latency=0.05, step_noise=0.01, seed=1)
+        robot.connect()
+        robot.enable_sensors = True
+
+        start = time.perf_counter()
+        moved = move_straight(robot, distance, omega, 10, mm_speed=speed)
+        x, y, theta = robot.pose
+        turn_error = (theta - expected[2] + math.pi) % (2 * math.pi) - math.pi
+        print(f"moved {moved:.1f} mm, true pose x={x:.1f} y={y:.1f} theta={math.degrees(theta):.1f}, error "
+              f"x={x - expected[0]:.1f} y={y - expected[1]:.1f} theta={math.degrees(turn_error):.1f}, "
+              f"{robot.monotonic():.1f}s simulated in {time.perf_counter() - start:.3f}s")
@@ -1,12 +1,13 @@
 # TASK 1: Simple Open Loop Controller
 
-import time
 from epuck_helper_functions import steps_to_mm, mm_to_steps
+from epuck_rate import RateLoop
+from epuck_motion import StepTargetExecutor
 from epuck_ip import EPuckIP
 
 
 # Task 1: Move the robot a specific number of motor steps
-def move_steps(epuckcomm, l_speed_steps_s, r_speed_steps_s, l_target_steps, r_target_steps, Hz=30):
+def move_steps(epuckcomm, l_speed_steps_s, r_speed_steps_s, l_target_steps, r_target_steps, Hz=30, compensate_latency=True):
     """
     Move the robot based on motor steps.
 
@@ -17,57 +18,38 @@ def move_steps(epuckcomm, l_speed_steps_s, r_speed_steps_s, l_target_steps, r_ta
         l_target_steps: Target steps for the left wheel.
         r_target_steps: Target steps for the right wheel.
         Hz: Control loop frequency (default: 10 Hz).
+        compensate_latency: Send each wheel's stop ahead of its predicted target crossing by the measured round trip
+            latency (see epuck_motion), instead of once a reading shows the target was passed.
 
     Returns:
         A tuple of actual steps moved: (left_steps_moved, right_steps_moved).
     """
-    # Set the target motor speeds
-    epuckcomm.state.act_left_motor_speed = l_speed_steps_s
-    epuckcomm.state.act_right_motor_speed = r_speed_steps_s
-    epuckcomm.state.sens_left_motor_steps = 0
-    epuckcomm.state.sens_right_motor_steps = 0
+    # Record the initial motor step counts, then set the target motor speeds
+    executor = StepTargetExecutor(epuckcomm, l_speed_steps_s, r_speed_steps_s, l_target_steps, r_target_steps,
+                                  compensate=compensate_latency)
+    executor.start()
 
-    epuckcomm.send_command()
-    epuckcomm.data_update()
+    # The loop runs on absolute deadlines so the body's time doesn't slow the rate
+    loop = RateLoop(Hz, clock=epuckcomm)
+    loop.wait()
 
-
-    # Wait briefly to allow updates
-    time.sleep(1 / Hz)
-    epuckcomm.data_update()
-
-    # Record the initial motor step counts
-    left_start = epuckcomm.state.sens_left_motor_steps
-    right_start = epuckcomm.state.sens_right_motor_steps
-
-    left_moved = 0
-    right_moved = 0
-
-    while abs(left_moved) < abs(l_target_steps) or abs(right_moved) < abs(r_target_steps):
+    while not executor.done():
         epuckcomm.data_update()
-        left_current = epuckcomm.state.sens_left_motor_steps
-        right_current = epuckcomm.state.sens_right_motor_steps
-
-        # Calculate the relative steps moved
-        left_moved = left_current - left_start
-        right_moved = right_current - right_start
+        executor.update()
 
-        # Stop the left motor if the target is reached
-        if abs(left_moved) >= abs(l_target_steps):
-            epuckcomm.state.act_left_motor_speed = 0
+        # Stop each motor at its target. Stops due before the next tick are sent at their exact time
+        executor.stop_wheels(loop.period)
 
-        # Stop the right motor if the target is reached
-        if abs(right_moved) >= abs(r_target_steps):
-            epuckcomm.state.act_right_motor_speed = 0
+        print(f"Left Moved: {executor.left_moved}, Right Moved: {executor.right_moved}")
+        loop.wait()
 
-        # Send updated commands to the robot
-        epuckcomm.send_command()
-        print(f"Left Moved: {left_moved}, Right Moved: {right_moved}")
-        time.sleep(1 / Hz)
+    left_moved, right_moved = executor.left_moved, executor.right_moved
 
     # Final motor step counts
     left_end = epuckcomm.state.sens_left_motor_steps
     right_end = epuckcomm.state.sens_right_motor_steps
     print(f"Final Left: {left_end}, Final Right: {right_end}")
+    print(f"Control loop: {loop.report()}, round trip latency {(executor.latency or 0)*1000:.0f} ms")
 
     # Stop all motors
     epuckcomm.stop_all()
@@ -3,8 +3,9 @@
 import time
 from threading import Thread
 from pynput import keyboard
-from epuck_open_loop_forward_kinematics import diff_drive_forward_kin
 from epuck_helper_functions import print_pose
+from epuck_odometry import OdometryEngine
+from epuck_rate import RateLoop
 from epuck_com import EPuckCom
 from epuck_ip import EPuckIP
 
@@ -39,12 +40,13 @@ def teleoperate_robot(epuck, initial_pose=(0, 0, 0), Hz=10):
         initial_pose: Tuple (x, y, theta), initial robot pose.
         Hz: Control loop frequency.
     """
-    current_pose = initial_pose
-    left_steps_last = epuck.state.sens_left_motor_steps
-    right_steps_last = epuck.state.sens_right_motor_steps
+    # Odometry is integrated on every sensor packet, not once per control tick
+    odometry = OdometryEngine(initial_pose)
+    epuck.add_listener(odometry)
 
     loop_interval = 1 / Hz
     time_elapsed = 0
+    loop = RateLoop(Hz, clock=epuck)
 
     try:
         while True:
@@ -79,30 +81,24 @@ def teleoperate_robot(epuck, initial_pose=(0, 0, 0), Hz=10):
             epuck.state.act_right_motor_speed = r_speed
             epuck.send_command()
 
-            # Update sensor data
+            # Update sensor data (the odometry listener updates the pose)
             epuck.data_update()
-            left_steps_current = epuck.state.sens_left_motor_steps
-            right_steps_current = epuck.state.sens_right_motor_steps
-
-            # Calculate step deltas
-            left_delta = left_steps_current - left_steps_last
-            right_delta = right_steps_current - right_steps_last
-            left_steps_last = left_steps_current
-            right_steps_last = right_steps_current
-
-            # Update robot pose
-            current_pose = diff_drive_forward_kin(current_pose, left_delta, right_delta)
 
             # Print pose every second
             time_elapsed += loop_interval
             if time_elapsed >= 1.0:
-                print_pose(current_pose)
+                print_pose(odometry.pose)
                 time_elapsed = 0
 
-            time.sleep(loop_interval)
+            loop.wait()
     except KeyboardInterrupt:
         print("Exiting teleoperation.")
+        print(f"Control loop: {loop.report()}")
         epuck.stop_all()
+    finally:
+        epuck.remove_listener(odometry)
+
+    return odometry.pose
 
 
 # Main program
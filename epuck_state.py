@@ -1,4 +1,6 @@
 
+from epuck_packets import SensorChannels, decode_sensors_into
+
 #constants for readibility sanity
 R = X = 0
 G = Y = 1
@@ -48,46 +50,32 @@ SENS_GROUND_RIGHT = 2
  SENS_PROX_L_45,
  SENS_PROX_L_10) = range(SENS_PROXIMITY_COUNT)
 
-class EPuckState():
+# Per-robot state. Each EPuck owns its own instance, so several robots can live in one process.
+# Sensor groups are stored in typed arrays (see epuck_packets.SensorChannels) that are filled in place on every packet.
+class EPuckState(SensorChannels):
 
-    #actuators to set
-    act_left_motor_speed = 0  # -1000..1000, steps / second?
-    act_right_motor_speed = 0
-    act_binary_led_states = [False]*BINARY_LED_COUNT
-    act_rgb_led_colors = [ (0,0,0) ]*RGB_LED_COUNT
-    act_speaker_sound = SOUND_STOP
-    
-    ## things to read
-    sens_framebuffer = None
-    sens_accelerometer = [0, 0, 0]  #X Y Z
-    sens_acceleration = 0
-    sens_orientation = 0
-    sens_inclination = 0
-    sens_gyro = [0, 0, 0] #X Y Z
-    sens_magnetometer = [0, 0, 0] #X Y Z
-    sens_temperature = 0
-    sens_proximity = [0]*SENS_PROXIMITY_COUNT
-    sens_ambient = [0]*SENS_AMBIENT_COUNT
-    sens_tof_distance_mm = 0
-    sens_mic_volume = [0]*SENS_MIC_COUNT
-    sens_left_motor_steps = 0
-    sens_right_motor_steps = 0
-    sens_battery_mv = 0
-    sens_has_SD = False
-    sens_selector_pos = 0
-    sens_ground_prox = [0]*SENS_GROUND_AMB_COUNT
-    sens_ground_amp = [0]*SENS_GROUND_AMB_COUNT
-    sens_button_press = False
-
-    #camera parameters loaded from robot/library
-    cam_mode = -1
-    cam_width = -1
-    cam_height = -1
-    cam_zoom = -1
-    cam_framebytes = -1
-
-    def __init__(self): 
-        pass
+    __slots__ = ("act_left_motor_speed", "act_right_motor_speed", "act_binary_led_states", "act_rgb_led_colors",
+                 "act_speaker_sound", "sens_framebuffer",
+                 "cam_mode", "cam_width", "cam_height", "cam_zoom", "cam_framebytes")
+
+    def __init__(self):
+        super().__init__()  # sensors to read, all zeroed
+
+        #actuators to set
+        self.act_left_motor_speed = 0  # -1000..1000, steps / second?
+        self.act_right_motor_speed = 0
+        self.act_binary_led_states = [False]*BINARY_LED_COUNT
+        self.act_rgb_led_colors = [ (0,0,0) ]*RGB_LED_COUNT
+        self.act_speaker_sound = SOUND_STOP
+
+        self.sens_framebuffer = None
+
+        #camera parameters loaded from robot/library
+        self.cam_mode = -1
+        self.cam_width = -1
+        self.cam_height = -1
+        self.cam_zoom = -1
+        self.cam_framebytes = -1
 
     def __str__(self):
         ##column widths for auto alignment
@@ -127,7 +115,6 @@ class EPuckState():
         return output
     
     def stop_all(self):
-        self.enable_camera = self.enable_sensors = False
         self.act_left_motor_speed = 0 
         self.act_right_motor_speed = 0
         self.act_binary_led_states = [False]*BINARY_LED_COUNT
@@ -135,7 +122,7 @@ class EPuckState():
         self.act_speaker_sound = SOUND_STOP
 
 
-    def load_data(self, data):   # load data from a tuple representing all the sensors, in order of the com protocol, into variables. 
+    def load_data(self, data):   # load data from a tuple representing all the sensors, in order of the com protocol (see epuck_packets.SENSORS_PACKET), into variables.
             self.sens_accelerometer[X], self.sens_accelerometer[Y], self.sens_accelerometer[Z], \
             self.sens_acceleration, self.sens_orientation, self.sens_inclination, \
             self.sens_gyro[X], self.sens_gyro[Y], self.sens_gyro[Z], \
@@ -153,4 +140,7 @@ class EPuckState():
             self.sens_selector_pos, \
             self.sens_ground_prox[0], self.sens_ground_prox[1], self.sens_ground_prox[2], \
             self.sens_ground_amp[0], self.sens_ground_amp[1], self.sens_ground_amp[2], \
-            self.sens_button_press, dummy = data
\ No newline at end of file
+            self.sens_button_press = data
+
+    def load_packet(self, packet):  # fast path, decode a raw sensor packet straight into the sensor arrays
+        decode_sensors_into(packet, self)
@@ -0,0 +1,216 @@
+import json
+import struct
+import threading
+import time
+from epuck_packets import MOTOR_STEPS_OFFSET
+
+# Link instrumentation for any EPuck transport.
+#
+#   stats = LinkStats(dump_every=5)    # print a report every 5 s, or dump_path= to append JSON lines to a file
+#   robot.add_listener(stats)
+#   ...
+#   print(stats.report())              # or stats.snapshot() for a dict
+#
+# Per stream (sensors, frames, commands) it keeps HDR style histograms of the interval between packets and of the
+# bytes per second (one sample per second, the rate so far for streams shorter than that), plus totals. On top of that:
+#   age      how old the newest sensor packet is when data_update returns, i.e., how stale the data a controller
+#            acts on is. Only grows above 0 when packets wait, e.g., EPuckIP background receive or a backlog.
+#   effect   command to effect latency: after a command changes a motor speed, the time until the step counters in
+#            the sensor packets show the wheel speed moved at least halfway to the new speed.
+
+
+class Histogram():
+    """HDR style histogram of non negative values: exact below 2**sub_bits, about 2**(1-sub_bits) relative error above,
+    in fixed memory. Values are recorded in unit (default microseconds, for values in seconds)."""
+
+    def __init__(self, sub_bits=7, max_value_bits=40, unit=1e-6):
+        self._sub_bits = sub_bits
+        self._sub_count = 1 << sub_bits
+        self._half = self._sub_count >> 1
+        self._max = (1 << max_value_bits) - 1
+        self.unit = unit
+        self.counts = [0] * self._index(self._max) + [0]
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        if (value < self._sub_count): return value
+        shift = value.bit_length() - self._sub_bits
+        return self._sub_count + (shift - 1) * self._half + ((value >> shift) - self._half)
+
+    def _value(self, index):  #lowest value of a bucket
+        if (index < self._sub_count): return index
+        shift = (index - self._sub_count) // self._half + 1
+        return (self._half + (index - self._sub_count) % self._half) << shift
+
+    def record(self, value):
+        raw = min(self._max, max(0, int(value / self.unit)))
+        self.counts[self._index(raw)] += 1
+        self.count += 1
+        self.total += raw
+        if (self.min is None or raw < self.min): self.min = raw
+        if (self.max is None or raw > self.max): self.max = raw
+
+    def percentile(self, p):
+        if (not self.count): return 0.0
+        rank = max(1, round(p / 100 * self.count))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if (seen >= rank): return min(self._value(index), self.max) * self.unit
+        return self.max * self.unit
+
+    def mean(self):
+        return self.total / self.count * self.unit if self.count else 0.0
+
+    def summary(self):
+        return {"count": self.count, "mean": self.mean(), "min": (self.min or 0) * self.unit,
+                "p50": self.percentile(50), "p90": self.percentile(90), "p99": self.percentile(99),
+                "max": (self.max or 0) * self.unit}
+
+
+class StreamStats():
+    """Arrival statistics of one packet stream."""
+
+    def __init__(self):
+        self.packets = 0
+        self.bytes = 0
+        self.last = None                           # timestamp of the last packet
+        self.intervals = Histogram()               # s between packets
+        self.bytes_per_second = Histogram(unit=1)  # one sample per whole second
+        self._second_start = None
+        self._second_bytes = 0
+
+    def record(self, timestamp, size):
+        if (self.last is not None): self.intervals.record(timestamp - self.last)
+        self.last = timestamp
+        self.packets += 1
+        self.bytes += size
+        if (self._second_start is None): self._second_start = timestamp
+        elapsed = timestamp - self._second_start
+        if (elapsed >= 1.0):
+            self.bytes_per_second.record(self._second_bytes / elapsed)
+            self._second_start = timestamp
+            self._second_bytes = 0
+        self._second_bytes += size
+
+    def rate_summary(self):
+        """Summary of bytes_per_second, None before the first packet. Until a whole second has gone by it is the rate
+        over the part of the stream seen so far (count 0)."""
+        if (not self.packets): return None
+        if (self.bytes_per_second.count): return self.bytes_per_second.summary()
+        elapsed = self.last - self._second_start
+        rate = self._second_bytes / elapsed if elapsed > 0 else float(self._second_bytes)  # a lone packet: its bytes
+        return {"count": 0, "mean": rate, "min": rate, "p50": rate, "p90": rate, "p99": rate, "max": rate}
+
+    def summary(self):
+        return {"packets": self.packets, "bytes": self.bytes, "interval": self.intervals.summary(),
+                "bytes_per_second": self.rate_summary()}
+
+
+class LinkStats():
+    """EPuck listener measuring packet rates, throughput, data age and command to effect latency."""
+
+    _MOTOR_STEPS = struct.Struct("<HH")
+
+    def __init__(self, dump_every=None, dump_path=None, min_speed_change=50):
+        """
+        Args:
+            dump_every: seconds between periodic dumps, None for no dumps.
+            dump_path: append each dump as a JSON line to this file instead of printing the report.
+            min_speed_change: smallest motor speed change (steps/s) that is timed for the effect latency.
+        """
+        self.sensors = StreamStats()
+        self.frames = StreamStats()
+        self.commands = StreamStats()
+        self.age = Histogram()
+        self.effect = Histogram()
+        self.dump_every = dump_every
+        self.dump_path = dump_path
+        self.min_speed_change = min_speed_change
+        self._next_dump = None
+        self._lock = threading.Lock()   # a background receiver and the user thread both report here
+
+        self._speeds = (0, 0)           # last commanded motor speeds
+        self._pending = None            # (command time, old speeds, new speeds) waiting for its effect
+        self._last_steps = None         # (timestamp, left, right) of the previous sensor packet
+        self._seen_seq = 0
+
+    ### listener interface
+    def on_sensors(self, robot, packet, timestamp):
+        with self._lock:
+            self.sensors.record(timestamp, len(packet))
+            self._check_effect(packet, timestamp)
+        self._maybe_dump(timestamp)
+
+    def on_frame(self, robot, frame):
+        with self._lock:
+            self.frames.record(frame.timestamp, len(frame.buffer))
+
+    def on_command(self, robot, packet, timestamp):
+        speeds = (robot.state.act_left_motor_speed, robot.state.act_right_motor_speed)
+        with self._lock:
+            self.commands.record(timestamp, len(packet))
+            if (speeds != self._speeds):
+                change = max(abs(new - old) for new, old in zip(speeds, self._speeds))
+                # a change still in flight is dropped, its effect can't be told apart from this one
+                self._pending = (timestamp, self._speeds, speeds) if change >= self.min_speed_change else None
+                self._speeds = speeds
+
+    def on_update(self, robot, timestamp):
+        if (robot.sensors_seq == self._seen_seq): return
+        self._seen_seq = robot.sensors_seq
+        with self._lock:
+            self.age.record(timestamp - robot.sensors_timestamp)
+
+    ### command to effect
+    def _check_effect(self, packet, timestamp):
+        left, right = self._MOTOR_STEPS.unpack_from(packet, MOTOR_STEPS_OFFSET)
+        last, self._last_steps = self._last_steps, (timestamp, left, right)
+        if (self._pending is None or last is None or timestamp <= last[0]): return
+        sent, old, new = self._pending
+        if (last[0] < sent): return  # need a speed measured entirely after the command
+        dt = timestamp - last[0]
+        for wheel, steps in ((0, left), (1, right)):
+            moved = (steps - last[wheel + 1] + 0x8000) % 0x10000 - 0x8000  # 16 bit counter wraparound
+            change = new[wheel] - old[wheel]
+            if (abs(change) >= self.min_speed_change and abs(moved / dt - old[wheel]) >= abs(change) / 2):
+                self.effect.record(timestamp - sent)
+                self._pending = None
+                return
+
+    ### reporting
+    def snapshot(self):
+        with self._lock:
+            return {"time": time.time(), "sensors": self.sensors.summary(), "frames": self.frames.summary(),
+                    "commands": self.commands.summary(), "age": self.age.summary(), "effect": self.effect.summary()}
+
+    def report(self):
+        s = self.snapshot()
+        lines = []
+        for name in ("sensors", "frames", "commands"):
+            stream = s[name]
+            if (not stream["packets"]): continue
+            interval = stream["interval"]
+            lines.append(f"{name}: {stream['packets']} packets, interval p50 {interval['p50']*1000:.1f} ms "
+                         f"p99 {interval['p99']*1000:.1f} ms max {interval['max']*1000:.1f} ms, "
+                         f"{stream['bytes_per_second']['p50']/1000:.1f} kB/s")
+        for name in ("age", "effect"):
+            hist = s[name]
+            if (hist["count"]):
+                lines.append(f"{name}: p50 {hist['p50']*1000:.1f} ms p99 {hist['p99']*1000:.1f} ms "
+                             f"max {hist['max']*1000:.1f} ms over {hist['count']}")
+        return "\n".join(lines)
+
+    def _maybe_dump(self, timestamp):
+        if (self.dump_every is None): return
+        if (self._next_dump is None): self._next_dump = timestamp + self.dump_every
+        if (timestamp < self._next_dump): return
+        self._next_dump = timestamp + self.dump_every
+        if (self.dump_path is None):
+            print(self.report())
+        else:
+            with open(self.dump_path, "a") as f:
+                f.write(json.dumps(self.snapshot()) + "\n")
@@ -0,0 +1,140 @@
+from collections import deque
+import numpy as np
+
+# Composable sensor streams on top of EPuck.data_update.
+#
+# sensor_packets(robot) is a generator of the robot state, one item per newly received sensor packet. Stages are
+# generators too: each takes a stream and yields one output per input, doing a constant amount of work per packet, so
+# chains are pulled lazily, packet by packet:
+#
+#   tof = median(field(sensor_packets(robot), "sens_tof_distance_mm"), 5)
+#   for distance in tof: ...
+#
+# Values are numbers, or numpy arrays for multi sensor channels (proximity, ground, ...), worked on per sensor.
+#
+# To filter several channels of one robot at once, e.g., for state.State machines, put the chains in a
+# StreamPipeline. Its update() does one data_update and pushes a new packet through every chain; states then read the
+# latest filtered values:
+#
+#   pipeline = StreamPipeline(robot)
+#   pipeline.add("front", lambda s: ema(field(s, "sens_proximity"), 0.3))
+#   pipeline.add("button", lambda s: debounce(field(s, "sens_button_press"), 3))
+#   pipeline.add("on_line", lambda s: threshold(field(s, "sens_ground_prox"), on=300, off=400, below=True))
+#   ...
+#   pipeline.update()             # once per tick
+#   if (pipeline["on_line"][0]): ...
+
+
+### sources
+def sensor_packets(robot, poll=0.001):
+    """The robot state after each new sensor packet, until the robot disconnects. Waits (robot.sleep(poll)) between
+    data_update calls while no new packet is in. The state object is reused, take values out with field()."""
+    seq = robot.sensors_seq
+    while (robot.is_connected()):
+        robot.data_update()
+        if (robot.sensors_seq == seq):
+            robot.sleep(poll)
+            continue
+        seq = robot.sensors_seq
+        yield robot.state
+
+
+def field(stream, name):
+    """A state attribute of every item, multi sensor channels copied out into float arrays."""
+    for state in stream:
+        value = getattr(state, name)
+        yield value if isinstance(value, (bool, int, float)) else np.array(value, dtype=float)
+
+
+### stages
+def ema(stream, alpha):
+    """Exponential moving average, alpha is the weight of the newest value (0..1]."""
+    average = None
+    for value in stream:
+        average = value if average is None else average + alpha * (value - average)
+        yield average
+
+
+def median(stream, window):
+    """Median of the last window values (fewer at the start)."""
+    values = deque(maxlen=window)
+    for value in stream:
+        values.append(value)
+        yield np.median(values, axis=0) if len(values) > 1 else value
+
+
+def debounce(stream, count):
+    """Holds the output until a new value has been seen count packets in a row, e.g., for sens_button_press."""
+    output = candidate = None
+    seen = 0
+    for value in stream:
+        if (output is None): output = value
+        if (np.array_equal(value, output)):
+            seen = 0
+        elif (candidate is not None and np.array_equal(value, candidate)):
+            seen += 1
+        else:
+            candidate, seen = value, 1
+        if (seen >= count):
+            output, seen = value, 0
+        yield output
+
+
+def threshold(stream, on, off=None, below=False):
+    """
+    True while the value is past on, with hysteresis: it only goes back to False once past off.
+    below=True for values that drop when the condition holds, e.g., ground sensors over a dark line.
+    """
+    if (off is None): off = on
+    state = None
+    for value in stream:
+        if (below):
+            now_on, now_off = np.less(value, on), np.greater(value, off)
+        else:
+            now_on, now_off = np.greater(value, on), np.less(value, off)
+        state = now_on if state is None else (state | now_on) & ~now_off
+        yield state
+
+
+### several chains over one robot
+class _Feed():
+    """Iterator yielding the current state, the source of every chain of a pipeline."""
+
+    def __init__(self, robot):
+        self._robot = robot
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self._robot.state
+
+
+class StreamPipeline():
+
+    def __init__(self, robot):
+        self.robot = robot
+        self.values = {}       # latest output of each chain
+        self._chains = {}
+        self._seq = robot.sensors_seq
+
+    def add(self, name, build):
+        """build(stream) makes the chain from a stream of states, e.g., lambda s: ema(field(s, "sens_tof_distance_mm"), 0.2)"""
+        self._chains[name] = iter(build(_Feed(self.robot)))
+        self.values[name] = None
+
+    def __getitem__(self, name):
+        return self.values[name]
+
+    def update(self):
+        """One data_update. Returns True if a new sensor packet came in and went through the chains."""
+        self.robot.data_update()
+        return self.push()
+
+    #run the chains on the state, if it holds a packet they have not seen yet (for when data_update is done elsewhere)
+    def push(self):
+        if (self.robot.sensors_seq == self._seq): return False
+        self._seq = self.robot.sensors_seq
+        for name, chain in self._chains.items():
+            self.values[name] = next(chain)
+        return True
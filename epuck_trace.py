@@ -0,0 +1,86 @@
+import json
+import os
+import threading
+import time
+
+# Timing spans for profiling sessions, exported as a Chrome trace (open in chrome://tracing or https://ui.perfetto.dev).
+#
+#   tracer = Tracer()
+#   robot.tracer = tracer     # spans for connect, send_command, data_update, parse and frame receive
+#   ...
+#   with tracer.span("my controller step"):   # user code can add its own spans
+#       ...
+#   tracer.save("session.json")
+#
+# With robot.tracer left at None (the default) the library only pays an attribute check per traced call.
+
+class Tracer():
+
+    def __init__(self, max_events=1000000):
+        self.max_events = max_events   # further events are dropped, so a forgotten tracer can't eat all memory
+        self.dropped = 0
+        self._events = []   # (name, start, end or None for an instant, thread id, args) in perf_counter seconds
+        self._origin = time.perf_counter()
+
+    now = staticmethod(time.perf_counter)
+
+    #record a span that started at start (a now() value) and ends now
+    def complete(self, name, start, args=None):
+        end = time.perf_counter()
+        if (len(self._events) >= self.max_events):
+            self.dropped += 1
+            return
+        self._events.append((name, start, end, threading.get_native_id(), args))
+
+    def instant(self, name, args=None):
+        if (len(self._events) >= self.max_events):
+            self.dropped += 1
+            return
+        self._events.append((name, time.perf_counter(), None, threading.get_native_id(), args))
+
+    def span(self, name, **args):
+        return _Span(self, name, args or None)
+
+    def __len__(self):
+        return len(self._events)
+
+    def clear(self):
+        self._events = []
+        self.dropped = 0
+
+    ### export
+    def to_chrome(self):
+        pid = os.getpid()
+        events = []
+        for name, start, end, tid, args in self._events:
+            event = {"name": name, "cat": "epuck", "pid": pid, "tid": tid, "ts": (start - self._origin) * 1e6}
+            if (end is None):
+                event["ph"] = "i"
+                event["s"] = "t"
+            else:
+                event["ph"] = "X"
+                event["dur"] = (end - start) * 1e6
+            if (args): event["args"] = args
+            events.append(event)
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_chrome(), f)
+
+
+class _Span():
+    __slots__ = ("_tracer", "_name", "_args", "_start")
+
+    def __init__(self, tracer, name, args):
+        self._tracer = tracer
+        self._name = name
+        self._args = args
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._tracer.complete(self._name, self._start, self._args)
+        return False
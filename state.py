@@ -3,6 +3,7 @@ from abc import ABC, abstractmethod
 class State(ABC):
     
     _debug = False
+    machine = None  # the state_scheduler.Machine running this state, if any
     def __init__(self, controller, parent, debug=True):
         self.controller = controller  
         self.parent = parent  # stores all the state variables
@@ -22,8 +23,11 @@ class State(ABC):
         pass
     
     def transition_to(self, to_state):  #does transition from current state to a new one, returning the new state
-        if (self._debug): print ("entering: "+str(to_state.__class__))
+        machine = self.machine
+        if (machine is not None): machine.transitioned(self, to_state)  # traced by the scheduler, not printed
+        elif (self._debug): print ("entering: "+str(to_state.__class__))
         self.leave()
+        to_state.machine = machine
         to_state.enter()
         return to_state
 
@@ -59,3 +63,9 @@ class State(ABC):
 # the transition_to method calls the appropriate exit and enter functions
 
         
+#
+# States that need filtered sensor values can share an epuck_stream.StreamPipeline made in the planner setup: call
+# its update() once per planner tick (in place of data_update) and read the filtered values in the states.
+#
+# To run several machines (e.g., one planner per robot) on one tick, with timeouts and delayed transitions that don't
+# spin, see state_scheduler.Scheduler. States run by it have self.machine set and their transitions are traced.
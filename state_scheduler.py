@@ -0,0 +1,226 @@
+import time
+from collections import deque
+from epuck_rate import RateLoop, _WallClock
+from epuck_stats import Histogram
+
+# Runs many state.State machines, e.g., one per robot of a fleet, off a single tick source.
+#
+#   scheduler = Scheduler(Hz=20, clock=robot)       # robot.monotonic()/robot.sleep(), like epuck_rate.RateLoop
+#   scheduler.add("robot1", planner1.s_find_line, before=robot1.data_update)
+#   scheduler.add("robot2", planner2.s_find_line, before=robot2.data_update)
+#   scheduler.run(seconds=60)                      # or call scheduler.tick() from an existing loop
+#   print(scheduler.report())
+#
+# Inside a state, self.machine is the Machine running it (set by add() and handed on by transition_to):
+#
+#   self.machine.timeout(2.0, self.parent.s_search)          # go to s_search unless this state is left within 2 s
+#   return self.machine.transition_after(0.5, self.parent.s_turn)   # no updates for 0.5 s, then go to s_turn
+#   return self.machine.wait(1.0)                            # no updates for 1 s, then carry on in this state
+#
+# Timers live in a timer wheel, so a waiting machine costs nothing per tick, and timers set by a state are dropped
+# once it is left. Each tick has a time budget (the tick period by default): once it is used up the remaining machines
+# are updated first thing next tick, and the overrun is counted. Transitions are recorded in a bounded trace instead of
+# printed.
+
+
+class TimerWheel():
+    """Hashed timer wheel: slots of resolution seconds, O(1) to add a timer, advance() only visits the slots passed."""
+
+    def __init__(self, resolution, slots=256, now=0.0):
+        self.resolution = resolution
+        self._slots = [[] for _ in range(slots)]
+        self._tick = int(now // resolution)   # the last slot tick advanced over
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, deadline, callback):
+        """Calls callback() from advance() once the deadline's slot has gone by, i.e., up to resolution late."""
+        tick = max(self._tick + 1, self._slot_tick(deadline, -1))   # the slot tick at or after the deadline
+        self._slots[tick % len(self._slots)].append((tick, deadline, callback))
+        self._count += 1
+
+    #slot tick of time t, rounded down (direction 1) or up (-1). a nanosecond of slack keeps float error, e.g.,
+    #0.3 // 0.1 == 2.0, from pushing a timer a whole slot late
+    def _slot_tick(self, t, direction):
+        return direction * int((direction * t + 1e-9) // self.resolution)
+
+    def advance(self, now):
+        """Runs the timers due by now, in deadline order."""
+        target = self._slot_tick(now, 1)
+        if (target <= self._tick): return 0
+        slots = self._slots
+        due = []
+        # a full turn visits every slot once, more would only revisit them
+        first = max(self._tick + 1, target - len(slots) + 1)
+        for tick in range(first, target + 1):
+            slot = slots[tick % len(slots)]
+            if (not slot): continue
+            keep = [timer for timer in slot if timer[0] > target]
+            if (len(keep) != len(slot)):
+                due.extend(timer for timer in slot if timer[0] <= target)
+                slot[:] = keep
+        self._tick = target
+        due.sort(key=lambda timer: timer[1])
+        self._count -= len(due)
+        for _, _, callback in due:
+            callback()
+        return len(due)
+
+
+class TransitionTrace():
+    """Bounded log of transitions, (time, machine name, from state, to state). Storing is a tuple and an append,
+    names are only made when the trace is read."""
+
+    def __init__(self, size=1000):
+        self.events = deque(maxlen=size)
+        self.count = 0
+
+    def record(self, timestamp, machine, from_state, to_state):
+        self.events.append((timestamp, machine, from_state, to_state))
+        self.count += 1
+
+    def lines(self):
+        return [f"{timestamp:.3f} {machine}: {from_state.__class__.__name__} -> {to_state.__class__.__name__}"
+                for timestamp, machine, from_state, to_state in self.events]
+
+
+class Machine():
+    """One state machine of a Scheduler."""
+
+    def __init__(self, scheduler, name, state, before=None):
+        self.scheduler = scheduler
+        self.name = name
+        self.state = state
+        self.before = before        # called before each update, e.g., robot.data_update
+        self.updates = 0
+        self.waiting = False        # True while held by wait/transition_after
+        self._epoch = 0             # counts transitions, timers set in an earlier state are stale
+        state.machine = self
+
+    ### for the states
+    def timeout(self, seconds, to_state):
+        """Transition to to_state in seconds, unless the current state has been left by then."""
+        epoch = self._epoch
+        self.scheduler._add_timer(seconds, lambda: self._timed_transition(epoch, to_state))
+
+    def transition_after(self, seconds, to_state):
+        """Hold the machine (no updates) for seconds, then transition to to_state. Returns the current state, so an
+        update can end with return self.machine.transition_after(...)."""
+        self.waiting = True
+        epoch = self._epoch
+        self.scheduler._add_timer(seconds, lambda: self._timed_transition(epoch, to_state))
+        return self.state
+
+    def wait(self, seconds):
+        """Hold the machine (no updates) for seconds. Returns the current state."""
+        self.waiting = True
+        epoch = self._epoch
+        self.scheduler._add_timer(seconds, lambda: self._resume(epoch))
+        return self.state
+
+    ### for the scheduler
+    def transitioned(self, from_state, to_state):  #called by State.transition_to
+        self._epoch += 1
+        self.waiting = False
+        self.scheduler.trace.record(self.scheduler._clock.monotonic(), self.name, from_state, to_state)
+
+    def update(self):
+        if (self.before is not None): self.before()
+        state = self.state.update()
+        if (state is not None and state is not self.state):
+            if (getattr(state, "machine", None) is not self): state.machine = self   # returned without transition_to
+            self.state = state
+        self.updates += 1
+
+    def _timed_transition(self, epoch, to_state):
+        if (epoch != self._epoch): return
+        self.state = self.state.transition_to(to_state)
+
+    def _resume(self, epoch):
+        if (epoch == self._epoch): self.waiting = False
+
+
+class Scheduler():
+
+    def __init__(self, Hz, clock=None, budget=None, trace_size=1000):
+        """
+        Args:
+            Hz: tick rate.
+            clock: object with monotonic() and sleep(seconds), e.g., an EPuck. Wall time by default.
+            budget: seconds of machine updates allowed per tick, the tick period by default.
+            trace_size: number of transitions kept in the trace.
+        """
+        self.Hz = Hz
+        self.budget = budget if budget is not None else 1 / Hz
+        self.machines = []
+        self.trace = TransitionTrace(trace_size)
+        self.tick_time = Histogram()   # s spent updating machines per tick
+        self.ticks = 0
+        self.overruns = 0              # ticks that used up the budget before every machine was updated
+        self.deferred = 0              # machine updates pushed to the next tick by an overrun
+        self._clock = clock if clock is not None else _WallClock()
+        self._loop = RateLoop(Hz, clock=self._clock)
+        self._timers = TimerWheel(1 / Hz, now=self._clock.monotonic())
+        self._next = 0                 # machine to start the next tick with
+
+    def add(self, name, state, before=None):
+        """Run a machine starting in state, entered now. before() is called ahead of each of its updates."""
+        machine = Machine(self, name, state, before)
+        self.machines.append(machine)
+        state.enter()
+        return machine
+
+    def remove(self, machine):
+        index = self.machines.index(machine)
+        self.machines.pop(index)
+        if (index < self._next): self._next -= 1
+        if (self._next >= len(self.machines)): self._next = 0
+
+    def _add_timer(self, seconds, callback):
+        self._timers.add(self._clock.monotonic() + seconds, callback)
+
+    ### running
+    def tick(self):
+        """Fire the due timers, then update the machines that are not waiting, round robin within the budget."""
+        self._timers.advance(self._clock.monotonic())
+        machines = self.machines
+        start = time.perf_counter()
+        count = len(machines)
+        for i in range(count):
+            index = (self._next + i) % count
+            machine = machines[index]
+            if (machine.waiting): continue
+            machine.update()
+            if (time.perf_counter() - start > self.budget and i < count - 1):
+                self.overruns += 1
+                self.deferred += count - 1 - i
+                self._next = (index + 1) % count
+                break
+        else:
+            self._next = 0
+        self.tick_time.record(time.perf_counter() - start)
+        self.ticks += 1
+
+    def run(self, seconds=None, until=None):
+        """Tick at Hz for seconds, or until until() is true, or forever."""
+        end = self._clock.monotonic() + seconds if seconds is not None else None
+        self._loop.reset()
+        while ((end is None or self._clock.monotonic() < end) and (until is None or not until())):
+            self.tick()
+            self._loop.wait()
+
+    ### reporting
+    def stats(self):
+        return {"ticks": self.ticks, "overruns": self.overruns, "deferred": self.deferred,
+                "transitions": self.trace.count, "timers": len(self._timers), "tick_time": self.tick_time.summary(),
+                "loop": self._loop.stats()}
+
+    def report(self):
+        s = self.stats()
+        tick = s["tick_time"]
+        return (f"{len(self.machines)} machines, {s['ticks']} ticks, tick time p50 {tick['p50']*1000:.2f} ms "
+                f"p99 {tick['p99']*1000:.2f} ms max {tick['max']*1000:.2f} ms (budget {self.budget*1000:.1f} ms), "
+                f"{s['overruns']} overruns, {s['deferred']} deferred updates, {s['transitions']} transitions\n"
+                f"loop: {self._loop.report()}")